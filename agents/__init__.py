@@ -1,5 +1,10 @@
 from .agent_container import AgentContainer
+from .async_swarm import AsyncSwarm
+from .container_cache import AgentContainerCache
+from .context_builder import ContextBuilder
 from .db_agent import DBAccessorAgent
+from .summarizer import ConversationSummarizer
+from .turn_queue import UserTurnQueue
 
 # This makes the classes available when importing from agents package
-__all__ = ['AgentContainer', 'DBAccessorAgent']
+__all__ = ['AgentContainer', 'AgentContainerCache', 'AsyncSwarm', 'ContextBuilder', 'ConversationSummarizer', 'DBAccessorAgent', 'UserTurnQueue']
@@ -1,18 +1,53 @@
+from collections import deque
 from swarm import Agent
 from .db_agent import DBAccessorAgent
 from config import *
 import logging
 from db.models import User, Session
+from logging_setup import LogPayload
+from metrics import stage_timer
+from typing import List
 
 
 logger = logging.getLogger(__name__)
 
+# Shared, never mutated agent definitions; each container binds copies to its user's tool functions
+MEDICAL_ASSISTANT_TEMPLATE = Agent(
+    name="Medical Assistant",
+    instructions=MEDICAL_ASSISTANT_BASE_INSTRUCTION,
+    model=MEDICAL_ASSISTANT_MODEL
+)
+
+DOCTOR_TEMPLATE = Agent(
+    name="Doctor",
+    instructions=DOCTOR_PROMPT,
+    model=DOCTOR_MODEL
+)
+
+IMAGE_PROCESSING_TEMPLATE = Agent(
+    name="Интерпретатор изображений",
+    instructions="""Вы интерпретатор пользовательских изображений, вам нужно интерпретировать данные в текст для дальнейшей обработки
+Отвечай на русском""",
+    model="openai/gpt-4o"
+)
+
 class AgentContainer:
+    __slots__ = (
+        'user_context',
+        'summary',
+        'message_history',
+        'db_accessor_agent',
+        'current_agent',
+        '_medical_assistant_agent',
+        '_doctor_agent',
+        '_image_processing_agent'
+    )
+
     def __init__(self, user_id: str, db_manager):
-        logger.info(f"Initializing AgentContainer for user_id: {user_id}")
+        logger.info("Initializing AgentContainer for user_id: %s", user_id)
 
         # Create initial session and get user context
-        with db_manager.get_db_session() as session:
+        with db_manager.get_db_session(write=True) as session:
             user = session.query(User).filter_by(external_id=user_id).first()
             if not user:
                 user = User(external_id=user_id)
@@ -25,10 +60,20 @@ class AgentContainer:
             ).first()
 
             if not active_session:
-                active_session = Session(user_id=user.id, is_active=True)
+                active_session = Session(
+                    user_id=user.id,
+                    is_active=True,
+                    current_agent="Medical Assistant"
+                )
                 session.add(active_session)
                 session.flush()
 
+            # Remember which agent the user was talking to before eviction
+            saved_agent_name = active_session.current_agent
+
+            # (summary text, id of the last message it covers), kept current by the summarizer
+            self.summary = (active_session.summary, active_session.summary_message_id or 0)
+
             # Store user context
             self.user_context = {
                 'user_id': user.id,
@@ -36,46 +81,67 @@ class AgentContainer:
                 'external_user_id': user_id
             }
 
+        # Rolling window of recent conversation, hydrated once from the DB
+        self.message_history = deque(maxlen=MESSAGE_BUFFER_SIZE)
+
         # Initialize DB Accessor with user context
-        self.db_accessor_agent = DBAccessorAgent(db_manager, self.user_context)
-        
-        def transfer_to_doctor(reason):
-            """Transfers to doctor agent"""
-            print(reason)
-            return self.doctor_agent
-
-        def transfer_to_medical_assistant(reason):
-            """Transfers to medical assistant agent"""
-            print(reason)
-            return self.medical_assistant_agent
-
-            
-        # Add DB operations as available functions
-        shared_context_functions = [
+        self.db_accessor_agent = DBAccessorAgent(db_manager, self.user_context, self.message_history)
+        with stage_timer('history_query'):
+            self.message_history.extend(self.db_accessor_agent.get_recent_messages(
+                self.user_context['session_id'],
+                MESSAGE_BUFFER_SIZE
+            ))
+
+        # Agents are bound to this user on first use; most users never reach the doctor
+        self._medical_assistant_agent = None
+        self._doctor_agent = None
+        self._image_processing_agent = None
+
+        # Restore the agent persisted on the session, defaulting to the assistant
+        if saved_agent_name == DOCTOR_TEMPLATE.name:
+            self.current_agent = self.doctor_agent
+        else:
+            self.current_agent = self.medical_assistant_agent
+
+    @property
+    def medical_assistant_agent(self) -> Agent:
+        if self._medical_assistant_agent is None:
+            self._medical_assistant_agent = MEDICAL_ASSISTANT_TEMPLATE.model_copy(
+                update={"functions": self._shared_functions()}
+            )
+        return self._medical_assistant_agent
+
+    @property
+    def doctor_agent(self) -> Agent:
+        if self._doctor_agent is None:
+            self._doctor_agent = DOCTOR_TEMPLATE.model_copy(
+                update={"functions": self._shared_functions()}
+            )
+        return self._doctor_agent
+
+    @property
+    def image_processing_agent(self) -> Agent:
+        if self._image_processing_agent is None:
+            self._image_processing_agent = IMAGE_PROCESSING_TEMPLATE.model_copy(
+                update={"functions": [self.db_accessor_agent.save_image_interpretation]}
+            )
+        return self._image_processing_agent
+
+    def transfer_to_doctor(self, reason):
+        """Transfers to doctor agent"""
+        # The reason is written by the LLM from patient data
+        logger.debug("Transfer to doctor: %s", LogPayload(reason))
+        return self.doctor_agent
+
+    def transfer_to_medical_assistant(self, reason):
+        """Transfers to medical assistant agent"""
+        logger.debug("Transfer to medical assistant: %s", LogPayload(reason))
+        return self.medical_assistant_agent
+
+    def _shared_functions(self) -> List:
+        # Tool functions of the assistant and the doctor, bound to this user
+        return [
             self.db_accessor_agent.update_medical_record,
-            transfer_to_doctor,
-            transfer_to_medical_assistant
+            self.transfer_to_doctor,
+            self.transfer_to_medical_assistant
         ]
-
-        self.image_processing_agent = Agent(
-            name="Интерпретатор изображений",
-            instructions="""Вы интерпретатор пользовательских изображений, вам нужно интерпретировать данные в текст для дальнейшей обработки
-Отвечай на русском""",
-            model="openai/gpt-4o",
-            functions=[self.db_accessor_agent.save_image_interpretation]
-        )
-        
-        self.medical_assistant_agent = Agent(
-            name="Medical Assistant",
-            instructions=MEDICAL_ASSISTANT_BASE_INSTRUCTION,
-            model=MEDICAL_ASSISTANT_MODEL,
-            functions=shared_context_functions
-        )
-        self.current_agent = self.medical_assistant_agent
-
-        self.doctor_agent = Agent(
-            name="Doctor",
-            instructions=DOCTOR_PROMPT,
-            model=DOCTOR_MODEL,
-            functions=shared_context_functions
-        )
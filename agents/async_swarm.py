@@ -0,0 +1,290 @@
+from swarm import Swarm, Agent
+from swarm.core import __CTX_VARS_NAME__
+from swarm.types import Response
+from swarm.util import debug_print, function_to_json, merge_chunk
+from openai.types.chat.chat_completion_message_tool_call import (
+    ChatCompletionMessageToolCall,
+    Function,
+)
+from collections import defaultdict
+from metrics import HANDOFFS, LLM_CALL_SECONDS, LLM_TTFT_SECONDS, TOOL_CALL_SECONDS, record_llm_usage
+from typing import AsyncIterator, Dict, List, Sequence
+import asyncio
+import copy
+import json
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+class AsyncSwarm(Swarm):
+    """Swarm runner for an openai.AsyncOpenAI client.
+
+    get_chat_completion returns whatever client.chat.completions.create
+    returns, which is a coroutine for AsyncOpenAI, and is awaited here. Tool
+    functions (DB writes, handoffs) are synchronous and run in worker threads
+    to keep them off the event loop.
+
+    The agent instructions are always the first message so they form a
+    stable prompt prefix; for models matching cache_control_prefixes they
+    carry an explicit cache_control breakpoint. Token usage, including
+    cached prompt tokens, is accumulated in usage and exported with call
+    latency, time to first token, tool call latency and handoffs as
+    Prometheus metrics.
+    """
+
+    def __init__(self, client=None, cache_control_prefixes: Sequence[str] = ()):
+        super().__init__(client)
+        self.cache_control_prefixes = tuple(cache_control_prefixes)
+        self.usage = {
+            "completions": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0
+        }
+
+    def get_chat_completion(
+        self,
+        agent: Agent,
+        history: List,
+        context_variables: dict,
+        model_override: str,
+        stream: bool,
+        debug: bool,
+    ):
+        context_variables = defaultdict(str, context_variables)
+        instructions = (
+            agent.instructions(context_variables)
+            if callable(agent.instructions)
+            else agent.instructions
+        )
+        model = model_override or agent.model
+        system_message = {"role": "system", "content": instructions}
+        if model.startswith(self.cache_control_prefixes):
+            system_message["content"] = [{
+                "type": "text",
+                "text": instructions,
+                "cache_control": {"type": "ephemeral"}
+            }]
+        messages = [system_message] + history
+        debug_print(debug, "Getting chat completion for...:", messages)
+
+        tools = [function_to_json(f) for f in agent.functions]
+        # hide context_variables from model
+        for tool in tools:
+            params = tool["function"]["parameters"]
+            params["properties"].pop(__CTX_VARS_NAME__, None)
+            if __CTX_VARS_NAME__ in params["required"]:
+                params["required"].remove(__CTX_VARS_NAME__)
+
+        create_params = {
+            "model": model,
+            "messages": messages,
+            "tools": tools or None,
+            "tool_choice": agent.tool_choice,
+            "stream": stream,
+        }
+        if tools:
+            create_params["parallel_tool_calls"] = agent.parallel_tool_calls
+        if stream:
+            # The final chunk then carries token usage
+            create_params["stream_options"] = {"include_usage": True}
+
+        return self.client.chat.completions.create(**create_params)
+
+    def usage_stats(self) -> Dict:
+        prompt_tokens = self.usage["prompt_tokens"]
+        return {
+            **self.usage,
+            "cached_ratio": round(self.usage["cached_tokens"] / prompt_tokens, 3) if prompt_tokens else 0
+        }
+
+    def handle_tool_calls(self, tool_calls, functions, context_variables, debug) -> Response:
+        """Swarm.handle_tool_calls, timing each call separately"""
+        response = Response(messages=[], agent=None, context_variables={})
+        for tool_call in tool_calls:
+            with TOOL_CALL_SECONDS.labels(tool_call.function.name).time():
+                partial_response = super().handle_tool_calls([tool_call], functions, context_variables, debug)
+            response.messages.extend(partial_response.messages)
+            response.context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                response.agent = partial_response.agent
+        return response
+
+    def _record_usage(self, model: str, usage) -> None:
+        if usage is None:
+            return
+        record_llm_usage(model, usage)
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.usage["completions"] += 1
+        self.usage["prompt_tokens"] += usage.prompt_tokens or 0
+        self.usage["completion_tokens"] += usage.completion_tokens or 0
+        self.usage["cached_tokens"] += (getattr(details, "cached_tokens", None) or 0)
+
+    async def run(
+        self,
+        agent: Agent,
+        messages: List,
+        context_variables: dict = {},
+        model_override: str = None,
+        debug: bool = False,
+        max_turns: int = float("inf"),
+        execute_tools: bool = True,
+    ) -> Response:
+        active_agent = agent
+        context_variables = copy.deepcopy(context_variables)
+        history = copy.deepcopy(messages)
+        init_len = len(messages)
+
+        while len(history) - init_len < max_turns and active_agent:
+            model = model_override or active_agent.model
+            with LLM_CALL_SECONDS.labels(model, 'false').time():
+                completion = await self.get_chat_completion(
+                    agent=active_agent,
+                    history=history,
+                    context_variables=context_variables,
+                    model_override=model_override,
+                    stream=False,
+                    debug=debug,
+                )
+            self._record_usage(model, completion.usage)
+            message = completion.choices[0].message
+            debug_print(debug, "Received completion:", message)
+            message.sender = active_agent.name
+            history.append(json.loads(message.model_dump_json()))
+
+            if not message.tool_calls or not execute_tools:
+                debug_print(debug, "Ending turn.")
+                break
+
+            partial_response = await asyncio.to_thread(
+                self.handle_tool_calls,
+                message.tool_calls,
+                active_agent.functions,
+                context_variables,
+                debug
+            )
+            history.extend(partial_response.messages)
+            context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                HANDOFFS.labels(active_agent.name, partial_response.agent.name).inc()
+                active_agent = partial_response.agent
+
+        return Response(
+            messages=history[init_len:],
+            agent=active_agent,
+            context_variables=context_variables,
+        )
+
+    async def run_and_stream(
+        self,
+        agent: Agent,
+        messages: List,
+        context_variables: dict = {},
+        model_override: str = None,
+        debug: bool = False,
+        max_turns: int = float("inf"),
+        execute_tools: bool = True,
+    ) -> AsyncIterator[Dict]:
+        """Async counterpart of Swarm.run_and_stream.
+
+        Yields {"delim": "start"/"end"} around each completion, the raw
+        deltas in between, {"handoff": {...}} when a tool call switches
+        agents and finally {"response": Response}.
+        """
+        active_agent = agent
+        context_variables = copy.deepcopy(context_variables)
+        history = copy.deepcopy(messages)
+        init_len = len(messages)
+
+        while len(history) - init_len < max_turns:
+            message = {
+                "content": "",
+                "sender": active_agent.name,
+                "role": "assistant",
+                "function_call": None,
+                "tool_calls": defaultdict(
+                    lambda: {
+                        "function": {"arguments": "", "name": ""},
+                        "id": "",
+                        "type": "",
+                    }
+                ),
+            }
+
+            model = model_override or active_agent.model
+            started = time.perf_counter()
+            first_token = True
+            completion = await self.get_chat_completion(
+                agent=active_agent,
+                history=history,
+                context_variables=context_variables,
+                model_override=model_override,
+                stream=True,
+                debug=debug,
+            )
+
+            yield {"delim": "start"}
+            async for chunk in completion:
+                # Only the final chunk has usage (and no choices)
+                self._record_usage(model, getattr(chunk, "usage", None))
+                if not chunk.choices:
+                    continue
+                if first_token:
+                    LLM_TTFT_SECONDS.labels(model).observe(time.perf_counter() - started)
+                    first_token = False
+                delta = json.loads(chunk.choices[0].delta.model_dump_json())
+                if delta["role"] == "assistant":
+                    delta["sender"] = active_agent.name
+                yield delta
+                delta.pop("role", None)
+                delta.pop("sender", None)
+                merge_chunk(message, delta)
+            yield {"delim": "end"}
+            # Includes the time the consumer spent on each yielded delta
+            LLM_CALL_SECONDS.labels(model, 'true').observe(time.perf_counter() - started)
+
+            message["tool_calls"] = list(message.get("tool_calls", {}).values())
+            if not message["tool_calls"]:
+                message["tool_calls"] = None
+            debug_print(debug, "Received completion:", message)
+            history.append(message)
+
+            if not message["tool_calls"] or not execute_tools:
+                debug_print(debug, "Ending turn.")
+                break
+
+            tool_calls = [
+                ChatCompletionMessageToolCall(
+                    id=tool_call["id"],
+                    function=Function(
+                        arguments=tool_call["function"]["arguments"],
+                        name=tool_call["function"]["name"],
+                    ),
+                    type=tool_call["type"],
+                )
+                for tool_call in message["tool_calls"]
+            ]
+
+            partial_response = await asyncio.to_thread(
+                self.handle_tool_calls,
+                tool_calls,
+                active_agent.functions,
+                context_variables,
+                debug
+            )
+            history.extend(partial_response.messages)
+            context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                HANDOFFS.labels(active_agent.name, partial_response.agent.name).inc()
+                yield {"handoff": {"from": active_agent.name, "to": partial_response.agent.name}}
+                active_agent = partial_response.agent
+
+        yield {
+            "response": Response(
+                messages=history[init_len:],
+                agent=active_agent,
+                context_variables=context_variables,
+            )
+        }
@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+import threading
+import time
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+class AgentContainerCache:
+    """LRU cache of AgentContainer instances with an idle TTL.
+
+    Entries are kept ordered by last access, so both the size limit and the
+    TTL evict from the front of the ordered dict. Evicted users are rebuilt
+    from their User/Session rows on the next request.
+
+    The internal lock only guards dict bookkeeping; containers are built
+    outside of it, with one creation future per key so concurrent first
+    requests for the same user share a single construction.
+
+    Pinned entries (get_or_create(pin=True) until unpin) are never evicted,
+    so a turn in flight always writes into the cached container. The cache
+    may exceed max_size while more than max_size entries are pinned.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (container, last_access)
+        self._pending = {}  # key -> Future of a container under construction
+        self._pins = {}  # key -> number of holders that keep the entry from eviction
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached container for key and mark it as recently used"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries[key] = (entry[0], now)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_create(self, key: str, factory: Callable[[], Any], pin: bool = False) -> Any:
+        """Return the cached container for key, building it with factory on a miss.
+
+        With pin, the entry is also pinned; release it with unpin(key).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], now)
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if pin:
+                    self._pin(key)
+                return entry[0]
+
+            self.misses += 1
+            future = self._pending.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._pending[key] = future
+
+        if not is_owner:
+            # Another request is already building this container
+            container = future.result()
+            if not pin:
+                return container
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] is container:
+                    self._pin(key)
+                    return container
+            # Evicted or replaced before it could be pinned: look it up again
+            return self.get_or_create(key, factory, pin=True)
+
+        try:
+            container = factory()
+        except BaseException as e:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # Skip caching if the key was dropped (e.g. /clear) mid-construction
+            if self._pending.pop(key, None) is future:
+                if pin:
+                    self._pin(key)
+                self._insert(key, container, time.monotonic())
+        future.set_result(container)
+        return container
+
+    def unpin(self, key: str) -> None:
+        """Release a pin taken by get_or_create(pin=True); the entry counts as just used"""
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+                return
+            self._pins.pop(key, None)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], time.monotonic())
+                self._entries.move_to_end(key)
+
+    def put(self, key: str, container: Any) -> None:
+        """Insert or replace the container for key, evicting if over capacity"""
+        with self._lock:
+            self._insert(key, container, time.monotonic())
+
+    def pop(self, key: str) -> Optional[Any]:
+        """Remove and return the container for key, if cached"""
+        with self._lock:
+            self._pending.pop(key, None)
+            entry = self._entries.pop(key, None)
+            return entry[0] if entry else None
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Hit, miss and eviction counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "pending": len(self._pending),
+                "pinned": len(self._pins),
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _pin(self, key: str) -> None:
+        # Must be called with self._lock held
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def _insert(self, key: str, container: Any, now: float) -> None:
+        # Must be called with self._lock held
+        self._entries[key] = (container, now)
+        self._entries.move_to_end(key)
+        self._evict_expired(now)
+        excess = len(self._entries) - self.max_size
+        if excess <= 0:
+            return
+        # Least recently used first, skipping pinned entries
+        evicted_keys = []
+        for candidate in self._entries:
+            if len(evicted_keys) == excess:
+                break
+            if candidate not in self._pins:
+                evicted_keys.append(candidate)
+        for evicted_key in evicted_keys:
+            del self._entries[evicted_key]
+            self.evictions += 1
+            logger.info("Evicted AgentContainer for user %s (cache full)", evicted_key)
+
+    def _evict_expired(self, now: float) -> None:
+        # Must be called with self._lock held
+        expired = []
+        for key, (_, last_access) in self._entries.items():
+            if now - last_access < self.ttl_seconds:
+                break
+            if key not in self._pins:
+                expired.append(key)
+        for key in expired:
+            del self._entries[key]
+            self.evictions += 1
+            logger.info("Evicted AgentContainer for user %s (idle TTL)", key)
@@ -0,0 +1,239 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+logger = logging.getLogger(__name__)
+
+# Rough average for mixed Russian/English text when tiktoken is not installed
+CHARS_PER_TOKEN = 3
+# Role and separator tokens the chat format adds to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Below this many tokens a truncated message or record is dropped instead
+MIN_TRUNCATED_TOKENS = 32
+TRUNCATION_MARKER = " …[truncated]"
+IMAGE_ANALYSIS_PREFIX = "image_analysis_"
+PATIENT_DATA_HEADER = "Patient Data:\n"
+SUMMARY_HEADER = "Conversation summary:\n"
+SECTIONS = ("instructions", "patient_data", "summary", "history", "user")
+
+class TokenCounter:
+    """Counts tokens with tiktoken when it is installed, otherwise estimates from length"""
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning("tiktoken encoding %s unavailable, estimating tokens: %s", encoding_name, e)
+        # History and records repeat across turns, so counts are memoized
+        self.count = lru_cache(maxsize=8192)(self._count)
+
+    @property
+    def name(self) -> str:
+        return "tiktoken" if self._encoding is not None else "estimate"
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens, marking that it was truncated"""
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(max_tokens - self.count(TRUNCATION_MARKER), 0)
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return self._encoding.decode(tokens[:keep]) + TRUNCATION_MARKER
+        return text[:keep * CHARS_PER_TOKEN] + TRUNCATION_MARKER
+
+    def _count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+class ContextBuilder:
+    """Fits patient data and conversation history into a per-agent token budget.
+
+    The agent instructions and the new user messages are always sent. Patient
+    data may take up to patient_data_share of what is left: regular records
+    first, then image_analysis_* records newest first, each capped at
+    image_analysis_max_tokens. A conversation summary, when given, replaces
+    the history it covers and may take up to half of the rest. History gets
+    what remains, filled from the newest message backwards; the oldest
+    message that does not fit is truncated and anything older is dropped.
+    """
+
+    def __init__(
+        self,
+        budgets: Dict[str, int],
+        default_budget: int,
+        patient_data_share: float,
+        image_analysis_max_tokens: int,
+        counter: Optional[TokenCounter] = None
+    ):
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.patient_data_share = patient_data_share
+        self.image_analysis_max_tokens = image_analysis_max_tokens
+        self.counter = counter or TokenCounter()
+        self._lock = threading.Lock()
+        self._turns = 0
+        self._totals = dict.fromkeys(SECTIONS, 0)
+        self._last = dict.fromkeys(SECTIONS, 0)
+        self._dropped = {"messages": 0, "records": 0}
+        self._truncated = {"messages": 0, "records": 0}
+
+    def build(
+        self,
+        agent,
+        patient_data: Tuple,
+        history: List[Dict],
+        user_messages: List[Dict],
+        summary: Optional[str] = None
+    ) -> List[Dict]:
+        """Return the LLM message list for a turn of agent.
+
+        patient_data comes from prepare_patient_data, which callers cache for
+        as long as the records are unchanged.
+        """
+        budget = self.budgets.get(agent.name, self.default_budget)
+        instructions = agent.instructions if isinstance(agent.instructions, str) else ""
+        tokens = dict.fromkeys(SECTIONS, 0)
+        tokens["instructions"] = self._message_tokens(instructions)
+        tokens["user"] = sum(self._message_tokens(message["content"]) for message in user_messages)
+
+        remaining = max(budget - tokens["instructions"] - tokens["user"], 0)
+        patient_data, tokens["patient_data"] = self._fit_patient_data(
+            patient_data, int(remaining * self.patient_data_share)
+        )
+        remaining -= tokens["patient_data"]
+
+        context = [{"role": "system", "content": patient_data}]
+        if summary:
+            summary = self.counter.truncate(
+                SUMMARY_HEADER + summary, remaining // 2 - MESSAGE_OVERHEAD_TOKENS
+            )
+            tokens["summary"] = self._message_tokens(summary)
+            remaining -= tokens["summary"]
+            context.append({"role": "system", "content": summary})
+
+        history, tokens["history"] = self._fit_history(history, remaining)
+
+        with self._lock:
+            self._turns += 1
+            self._last = tokens
+            for section, count in tokens.items():
+                self._totals[section] += count
+
+        return context + history + user_messages
+
+    def stats(self) -> Dict:
+        with self._lock:
+            turns = self._turns
+            return {
+                "tokenizer": self.counter.name,
+                "turns": turns,
+                "last_tokens": dict(self._last),
+                "avg_tokens": {
+                    section: round(total / turns, 1) if turns else 0
+                    for section, total in self._totals.items()
+                },
+                "truncated": dict(self._truncated),
+                "dropped": dict(self._dropped)
+            }
+
+    def _message_tokens(self, content: str) -> int:
+        return self.counter.count(content or "") + MESSAGE_OVERHEAD_TOKENS
+
+    def prepare_patient_data(self, medical_records: Dict[str, Any]) -> Tuple[str, int, int, List[Tuple[str, int, bool]]]:
+        """Format and order medical records for _fit_patient_data.
+
+        Returns the full patient data text, its tokens, the number of lines
+        capped at image_analysis_max_tokens, and each line with its tokens and
+        whether it was capped.
+        Nothing here depends on the budget, so the result can be reused on
+        every turn until the records change.
+        """
+        regular = [item for item in medical_records.items() if not item[0].startswith(IMAGE_ANALYSIS_PREFIX)]
+        images = sorted(
+            (item for item in medical_records.items() if item[0].startswith(IMAGE_ANALYSIS_PREFIX)),
+            key=lambda item: _record_order(item[0]),
+            reverse=True
+        )
+
+        used = self._message_tokens(PATIENT_DATA_HEADER)
+        lines = []
+        for data_type, data in regular + images:
+            full = f"{data_type}: {data}"
+            line = full
+            if data_type.startswith(IMAGE_ANALYSIS_PREFIX):
+                line = self.counter.truncate(line, self.image_analysis_max_tokens)
+            tokens = self.counter.count(line)
+            lines.append((line, tokens, line is not full))
+            used += tokens + 1  # newline separator
+
+        text = PATIENT_DATA_HEADER + "\n".join(line for line, _, _ in lines)
+        return text, used, sum(capped for _, _, capped in lines), lines
+
+    def _fit_patient_data(self, patient_data: Tuple, budget: int) -> Tuple[str, int]:
+        text, used, capped_lines, lines = patient_data
+        if used <= budget:
+            # Every record fits: the common case costs no per-record work
+            self._count_trimmed("records", capped_lines, 0)
+            return text, used
+
+        used = self._message_tokens(PATIENT_DATA_HEADER)
+        kept = []
+        truncated = dropped = 0
+        for line, tokens, capped in lines:
+            available = budget - used - 1  # newline separator
+            if tokens > available:
+                if available < MIN_TRUNCATED_TOKENS:
+                    dropped += 1
+                    continue
+                line = self.counter.truncate(line, available)
+                tokens = self.counter.count(line)
+                capped = True
+
+            truncated += capped
+            kept.append(line)
+            used += tokens + 1
+
+        self._count_trimmed("records", truncated, dropped)
+        return PATIENT_DATA_HEADER + "\n".join(kept), used
+
+    def _fit_history(self, history: List[Dict], budget: int) -> Tuple[List[Dict], int]:
+        used = 0
+        kept = []
+        truncated = 0
+        for message in reversed(history):
+            tokens = self._message_tokens(message["content"])
+            if used + tokens > budget:
+                available = budget - used - MESSAGE_OVERHEAD_TOKENS
+                if available >= MIN_TRUNCATED_TOKENS:
+                    content = self.counter.truncate(message["content"], available)
+                    kept.append({"role": message["role"], "content": content})
+                    used += self._message_tokens(content)
+                    truncated = 1
+                break
+            # Buffer entries carry the message id, which the LLM API does not accept
+            kept.append({"role": message["role"], "content": message["content"]})
+            used += tokens
+
+        self._count_trimmed("messages", truncated, len(history) - len(kept))
+        kept.reverse()
+        return kept, used
+
+    def _count_trimmed(self, kind: str, truncated: int, dropped: int) -> None:
+        with self._lock:
+            self._truncated[kind] += truncated
+            self._dropped[kind] += dropped
+
+def _record_order(data_type: str) -> int:
+    # image_analysis_<image id>; later images have larger ids
+    suffix = data_type[len(IMAGE_ANALYSIS_PREFIX):]
+    return int(suffix) if suffix.isdigit() else 0
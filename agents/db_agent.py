@@ -1,7 +1,9 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from datetime import UTC, datetime
 from db.models import User, Session, Message, Image, MedicalRecord
 from pydantic import Field
+from sqlalchemy import insert
+import threading
 import logging
 
 
@@ -11,13 +13,22 @@ class DBAccessorAgent():
     # Declare db_manager as a model field
     db_manager: Any = Field(default=None, exclude=True)
 
-    def __init__(self, db_manager, user_context):
+    def __init__(self, db_manager, user_context, message_history=None):
         logger.info("Initializing DBAccessorAgent")
-        logger.info(f"Received db_manager: {db_manager}")
+        logger.info("Received db_manager: %s", db_manager)
 
         # Set db_manager after super().__init__
         object.__setattr__(self, 'db_manager', db_manager)
         object.__setattr__(self, 'user_context', user_context)
+        # Ring buffer of the session's recent LLM-visible messages, kept current by save_message and save_turn
+        object.__setattr__(self, 'message_history', message_history)
+        # Write-through cache of the user's medical records; the version changes with every
+        # committed write, loaded or not, so a load that raced a write can be detected
+        object.__setattr__(self, '_records_lock', threading.Lock())
+        object.__setattr__(self, '_medical_records', None)
+        object.__setattr__(self, '_records_version', 0)
+        # (records version, prompt-ready patient data) from get_patient_data
+        object.__setattr__(self, '_patient_data', None)
         logger.info("Completed DBAccessorAgent initialization")
 
     def get_user_context(self, external_user_id: str) -> Dict:
@@ -47,7 +58,7 @@ class DBAccessorAgent():
 
     def create_or_get_session(self, external_user_id: str) -> Dict:
         """Create new session or get active session for user"""
-        with self.db_manager.get_db_session() as session:
+        with self.db_manager.get_db_session(write=True) as session:
             # Find or create user
             user = session.query(User).filter_by(external_id=external_user_id).first()
             if not user:
@@ -77,7 +88,7 @@ class DBAccessorAgent():
 
     def save_message(self, session_id: int, role: str, content: str, visible_to_user: bool = True, message_metadata: Dict = None) -> Dict:
         """Save message to database"""
-        with self.db_manager.get_db_session() as session:
+        with self.db_manager.get_db_session(write=True) as session:
             message = Message(
                 session_id=session_id,
                 role=role,
@@ -89,23 +100,201 @@ class DBAccessorAgent():
             session.query(Session).filter_by(id=session_id).update({
                 "last_interaction": datetime.now(UTC)
             })
-            return {"status": "success", "message_id": message.id}
+            session.flush()
+            message_id = message.id
+
+        self._remember_message(session_id, message_id, role, content, visible_to_user)
+        return {"status": "success", "message_id": message_id}
+
+    def save_turn(
+        self,
+        session_id: int,
+        user_messages: List[Dict],
+        response_messages: List[Dict],
+        agent_name: Optional[str] = None,
+        handoff_to: Optional[str] = None
+    ) -> Dict:
+        """Persist a whole agent turn in one transaction.
+
+        Writes the user messages, every assistant/tool message, the hidden
+        handoff notice, the last_interaction bump and the new current_agent
+        with a single bulk insert and a single commit.
+        """
+        now = datetime.now(UTC)
+        timestamp = now.isoformat()
+        rows = []
+
+        for user_message in user_messages:
+            rows.append({
+                "session_id": session_id,
+                "role": user_message["role"],
+                "content": user_message["content"],
+                "visible_to_user": True,
+                "message_metadata": {"timestamp": timestamp}
+            })
+
+        for msg in response_messages:
+            rows.append({
+                "session_id": session_id,
+                "role": msg.get('role', 'assistant'),
+                "content": msg.get('content', ''),
+                # Save ALL messages including tool messages, but hide tool output
+                "visible_to_user": msg.get('role') != 'tool',
+                "message_metadata": {"agent": agent_name, "timestamp": timestamp}
+            })
+
+        if handoff_to:
+            rows.append({
+                "session_id": session_id,
+                "role": "assistant",
+                "content": f"Transferring you to {handoff_to}",
+                "visible_to_user": False,
+                "message_metadata": {
+                    "handoff_from": agent_name,
+                    "handoff_to": handoff_to,
+                    "timestamp": timestamp
+                }
+            })
+
+        session_update = {"last_interaction": now}
+        if handoff_to:
+            session_update["current_agent"] = handoff_to
 
-    def save_image(self, session_id: int, image_data: str) -> Dict:
-        """Save new image to database"""
+        message_ids = []
+        with self.db_manager.get_db_session(write=True) as session:
+            if rows:
+                message_ids = session.execute(
+                    insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                    rows
+                ).scalars().all()
+            session.query(Session).filter_by(id=session_id).update(session_update)
+
+        for message_id, row in zip(message_ids, rows):
+            self._remember_message(session_id, message_id, row["role"], row["content"], row["visible_to_user"])
+        return {"status": "success", "message_count": len(rows)}
+
+    def get_recent_messages(self, session_id: int, limit: int) -> List[Dict]:
+        """Get the last `limit` visible, non-tool, non-empty messages in chronological order"""
+        with self.db_manager.get_db_session() as session:
+            recent_messages = session.query(Message).filter(
+                Message.session_id == session_id,
+                Message.visible_to_user == True,
+                Message.role != 'tool',
+                Message.content.isnot(None),
+                Message.content != ''
+            ).order_by(
+                # Messages of one turn share created_at, so break ties by insert order
+                Message.created_at.desc(),
+                Message.id.desc()
+            ).limit(limit).all()
+
+            return [
+                {"id": msg.id, "role": msg.role, "content": msg.content}
+                for msg in reversed(recent_messages)  # Reverse to get chronological order
+            ]
+
+    def get_messages_after(self, session_id: int, after_message_id: int, limit: int) -> List[Dict]:
+        """Get up to `limit` visible, non-tool, non-empty messages newer than after_message_id, oldest first"""
         with self.db_manager.get_db_session() as session:
+            messages = session.query(Message).filter(
+                Message.session_id == session_id,
+                Message.id > after_message_id,
+                Message.visible_to_user == True,
+                Message.role != 'tool',
+                Message.content.isnot(None),
+                Message.content != ''
+            ).order_by(Message.id).limit(limit).all()
+
+            return [
+                {"id": msg.id, "role": msg.role, "content": msg.content}
+                for msg in messages
+            ]
+
+    def get_summary(self, session_id: int) -> Tuple[Optional[str], int]:
+        """Get the session's conversation summary and the id of the last message it covers"""
+        with self.db_manager.get_db_session() as session:
+            row = session.query(Session.summary, Session.summary_message_id).filter_by(id=session_id).first()
+            if row is None:
+                return None, 0
+            return row.summary, row.summary_message_id or 0
+
+    def save_summary(self, session_id: int, summary: str, summary_message_id: int) -> None:
+        """Store the session's conversation summary"""
+        with self.db_manager.get_db_session(write=True) as session:
+            session.query(Session).filter_by(id=session_id).update({
+                "summary": summary,
+                "summary_message_id": summary_message_id
+            })
+
+    def _remember_message(self, session_id: int, message_id: int, role: str, content: str, visible_to_user: bool) -> None:
+        # Mirror the get_recent_messages filter so the buffer matches the DB view
+        if self.message_history is None or session_id != self.user_context['session_id']:
+            return
+        if visible_to_user and role != 'tool' and content:
+            self.message_history.append({"id": message_id, "role": role, "content": content})
+
+    def save_image(self, session_id: int, image_bytes: bytes, mime_type: str = 'image/jpeg') -> Dict:
+        """Save new image to the blob store and record it in the database"""
+        content_hash = self.db_manager.blob_store.put(image_bytes)
+        with self.db_manager.get_db_session(write=True) as session:
             image = Image(
                 session_id=session_id,
-                image_data=image_data,
+                content_hash=content_hash,
+                size_bytes=len(image_bytes),
+                mime_type=mime_type,
                 processed=False
             )
             session.add(image)
             session.flush()
-            return {"status": "success", "image_id": image.id}
+            return {"status": "success", "image_id": image.id, "content_hash": content_hash}
+
+    def save_processed_images(self, session_id: int, images: List[Tuple[bytes, str, Optional[str]]]) -> List[Dict]:
+        """Save a batch of (image_bytes, mime_type, interpretation) in a single transaction.
+
+        Image bytes go to the blob store; interpreted images are marked processed
+        and their interpretation is stored as an image_analysis_<id> medical record.
+        """
+        content_hashes = [
+            self.db_manager.blob_store.put(image_bytes)
+            for image_bytes, _, _ in images
+        ]
+        with self.db_manager.get_db_session(write=True) as session:
+            image_rows = [
+                Image(
+                    session_id=session_id,
+                    content_hash=content_hash,
+                    size_bytes=len(image_bytes),
+                    mime_type=mime_type,
+                    interpretation=interpretation or None,
+                    processed=bool(interpretation)
+                )
+                for content_hash, (image_bytes, mime_type, interpretation) in zip(content_hashes, images)
+            ]
+            session.add_all(image_rows)
+            session.flush()
+
+            new_records = [
+                MedicalRecord(
+                    user_id=self.user_context['user_id'],
+                    data_type=f"image_analysis_{image.id}",
+                    data=image.interpretation
+                )
+                for image in image_rows
+                if image.interpretation
+            ]
+            session.add_all(new_records)
+            cached_records = [(record.data_type, record.data) for record in new_records]
+            results = [
+                {"status": "success", "image_id": image.id, "content_hash": image.content_hash}
+                for image in image_rows
+            ]
+
+        self._cache_records(cached_records)
+        return results
 
     def save_image_interpretation(self, image_id: int, interpretation: str) -> Dict:
         """Save interpretation for processed image"""
-        with self.db_manager.get_db_session() as session:
+        with self.db_manager.get_db_session(write=True) as session:
             image = session.query(Image).filter_by(id=image_id).first()
             if not image:
                 return {"error": "Image not found"}
@@ -115,20 +304,27 @@ class DBAccessorAgent():
             return {"status": "success", "image_id": image_id}
 
     def get_pending_images(self, session_id: int) -> List[Dict]:
-        """Get unprocessed images for session"""
+        """Get unprocessed images for session; bytes are read via db_manager.blob_store"""
         with self.db_manager.get_db_session() as session:
-            images = session.query(Image).filter_by(
+            images = session.query(
+                Image.id, Image.content_hash, Image.size_bytes, Image.mime_type
+            ).filter_by(
                 session_id=session_id,
                 processed=False
             ).all()
             return [
-                {"id": img.id, "image_data": img.image_data}
+                {
+                    "id": img.id,
+                    "content_hash": img.content_hash,
+                    "size_bytes": img.size_bytes,
+                    "mime_type": img.mime_type
+                }
                 for img in images
             ]
 
     def mark_image_processed(self, image_id: int) -> Dict:
         """Mark image as processed"""
-        with self.db_manager.get_db_session() as session:
+        with self.db_manager.get_db_session(write=True) as session:
             image = session.query(Image).filter_by(id=image_id).first()
             if not image:
                 return {"error": "Image not found"}
@@ -145,7 +341,7 @@ class DBAccessorAgent():
                         This should be a descriptive key in English (e.g., 'blood_pressure', 'allergies').
         data (str): The string value to be stored or updated for the specified key_name.
     """
-        with self.db_manager.get_db_session() as session:
+        with self.db_manager.get_db_session(write=True) as session:
             record = session.query(MedicalRecord).filter_by(
                 user_id=self.user_context['user_id'],
                 data_type= key_name
@@ -162,15 +358,69 @@ class DBAccessorAgent():
                 session.add(record)
 
             session.flush()
-            return {"status": "success", "record_id": record.id}
+            record_id = record.id
 
-    def get_medical_history(self) -> str:
-        """Get all medical records for user and format as string"""
-        with self.db_manager.get_db_session() as session:
-            records = session.query(MedicalRecord).filter_by(user_id=self.user_context['user_id']).all()
+        self._cache_records([(key_name, data)])
+        return {"status": "success", "record_id": record_id}
+
+    def get_medical_records(self) -> Dict[str, Any]:
+        """Get all medical records for user keyed by data_type"""
+        return self._records_snapshot()[0]
+
+    def get_patient_data(self, prepare: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Return prepare(medical records), recomputed only after the records change.
+
+        prepare must be the same function on every call, e.g.
+        ContextBuilder.prepare_patient_data.
+        """
+        with self._records_lock:
+            cached = self._patient_data
+            if cached is not None and cached[0] == self._records_version:
+                return cached[1]
+
+        records, version = self._records_snapshot()
+        patient_data = prepare(records)
+        with self._records_lock:
+            # A write landed while preparing: leave the cache to the next call
+            if version == self._records_version:
+                self._patient_data = (version, patient_data)
+        return patient_data
+
+    def _records_snapshot(self) -> Tuple[Dict[str, Any], int]:
+        with self._records_lock:
+            if self._medical_records is not None:
+                return dict(self._medical_records), self._records_version
+        return self._load_medical_records()
+
+    def _load_medical_records(self) -> Tuple[Dict[str, Any], int]:
+        while True:
+            with self._records_lock:
+                version = self._records_version
+
+            with self.db_manager.get_db_session() as session:
+                records = session.query(MedicalRecord).filter_by(user_id=self.user_context['user_id']).all()
+                loaded = {record.data_type: record.data for record in records}
+
+            with self._records_lock:
+                if self._medical_records is not None:
+                    return dict(self._medical_records), self._records_version
+                # A write committed during the read may be missing from it: read again
+                if version == self._records_version:
+                    self._medical_records = loaded
+                    return dict(loaded), version
 
-            formatted_records = []
-            for record in records:
-                formatted_records.append(f"{record.data_type}: {record.data}")
+    def invalidate_medical_history(self) -> None:
+        """Drop the cached medical records, e.g. after the user's data was cleared"""
+        with self._records_lock:
+            self._medical_records = None
+            self._patient_data = None
+            self._records_version += 1
 
-            return "\n".join(formatted_records)
+    def _cache_records(self, records: List[Tuple[str, Any]]) -> None:
+        # Apply committed writes to the cache; until it is loaded only the version moves
+        with self._records_lock:
+            self._records_version += 1
+            if self._medical_records is None:
+                return
+            for data_type, data in records:
+                self._medical_records[data_type] = data
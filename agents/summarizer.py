@@ -0,0 +1,108 @@
+from metrics import LLM_CALL_SECONDS, record_llm_usage
+from typing import Dict, List, Optional
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+class ConversationSummarizer:
+    """Rolls older messages of a session into a compact running summary.
+
+    Runs as a background task after a turn, off the request path, and only
+    over messages newer than the stored summary; the newest keep_recent
+    messages are left verbatim in the history. The summary and the id of
+    the last message it covers are stored on the session and mirrored on
+    the AgentContainer as agent_container.summary.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        prompt: str,
+        trigger_messages: int,
+        keep_recent: int,
+        batch_size: int = 100
+    ):
+        self.client = client
+        self.model = model
+        self.prompt = prompt
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.batch_size = batch_size
+        self._running = set()  # session ids with a summary in progress
+        self._tasks = set()
+        self.runs = 0
+        self.failures = 0
+        self.summarized_messages = 0
+
+    def maybe_schedule(self, agent_container) -> None:
+        """Start a background run if enough unsummarised messages are buffered"""
+        session_id = agent_container.user_context['session_id']
+        _, summary_message_id = agent_container.summary
+        # Snapshot: the buffer is appended to from worker threads while we count
+        unsummarized = sum(
+            1 for message in list(agent_container.message_history)
+            if message["id"] > summary_message_id
+        )
+        if unsummarized < self.trigger_messages or session_id in self._running:
+            return
+
+        self._running.add(session_id)
+        task = asyncio.create_task(self._summarize(agent_container, session_id))
+        # The loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict:
+        return {
+            "running": len(self._running),
+            "runs": self.runs,
+            "failures": self.failures,
+            "summarized_messages": self.summarized_messages
+        }
+
+    async def _summarize(self, agent_container, session_id: int) -> None:
+        db_accessor_agent = agent_container.db_accessor_agent
+        try:
+            summary, summary_message_id = await asyncio.to_thread(db_accessor_agent.get_summary, session_id)
+            messages = await asyncio.to_thread(
+                db_accessor_agent.get_messages_after,
+                session_id,
+                summary_message_id,
+                self.batch_size + self.keep_recent
+            )
+            messages = messages[:max(len(messages) - self.keep_recent, 0)]
+            if not messages:
+                return
+
+            with LLM_CALL_SECONDS.labels(self.model, 'false').time():
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": self.prompt},
+                        {"role": "user", "content": self._format_request(summary, messages)}
+                    ]
+                )
+            record_llm_usage(self.model, response.usage)
+            new_summary = response.choices[0].message.content
+            if not new_summary:
+                return
+
+            summary_message_id = messages[-1]["id"]
+            await asyncio.to_thread(db_accessor_agent.save_summary, session_id, new_summary, summary_message_id)
+            agent_container.summary = (new_summary, summary_message_id)
+            self.runs += 1
+            self.summarized_messages += len(messages)
+            logger.info("Summarised %d messages of session %s", len(messages), session_id)
+
+        except Exception as e:
+            self.failures += 1
+            logger.error("Error summarising session %s: %s", session_id, e)
+        finally:
+            self._running.discard(session_id)
+
+    def _format_request(self, summary: Optional[str], messages: List[Dict]) -> str:
+        conversation = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        return f"Текущее резюме:\n{summary or '(пусто)'}\n\nНовые сообщения:\n{conversation}"
@@ -0,0 +1,78 @@
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+class UserTurnQueue:
+    """Per-user ordered work queue (actor) for agent turns.
+
+    At most one turn runs per user at a time. Messages submitted while a
+    turn is in flight are queued and coalesced into the next turn, so
+    rapid-fire messages cost one LLM run instead of one each and the
+    conversation order stays deterministic. Turns of different users run
+    concurrently. State is per process.
+    """
+
+    def __init__(self):
+        self._pending = {}  # key -> [(message, future, run_turn)] waiting for the next turn
+        self._running = set()
+        self._tasks = set()
+        self.turns = 0
+        self.coalesced_messages = 0
+
+    async def submit(
+        self,
+        key: str,
+        message: Any,
+        run_turn: Callable[[List[Any]], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """Queue a message and wait for the turn that handles it.
+
+        Returns the turn's result and whether this message was the last one
+        of its batch; only that caller should deliver the result to the user.
+        run_turn is called with all messages of the batch in arrival order;
+        the callback of the batch's last message is the one used.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append((message, future, run_turn))
+        if key not in self._running:
+            self._running.add(key)
+            task = asyncio.create_task(self._drain(key))
+            # The loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await future
+
+    def stats(self) -> Dict:
+        return {
+            "active_users": len(self._running),
+            "queued_messages": sum(len(batch) for batch in self._pending.values()),
+            "turns": self.turns,
+            "coalesced_messages": self.coalesced_messages
+        }
+
+    async def _drain(self, key: str) -> None:
+        try:
+            while self._pending.get(key):
+                batch = self._pending.pop(key)
+                self.turns += 1
+                self.coalesced_messages += len(batch) - 1
+                if len(batch) > 1:
+                    logger.info("Coalescing %d messages into one turn for user %s", len(batch), key)
+
+                run_turn = batch[-1][2]
+                try:
+                    result = await run_turn([message for message, _, _ in batch])
+                except Exception as e:
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for index, (_, future, _) in enumerate(batch):
+                    if not future.done():
+                        future.set_result((result, index == len(batch) - 1))
+        finally:
+            self._running.discard(key)
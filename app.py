@@ -1,126 +1,403 @@
-import traceback
 import requests
-from config import IMAGE_INTERPRETATOR_MODEL, IMAGE_INTERPRETATOR_PROMPT
+from config import (
+    AGENT_CONTAINER_CACHE_SIZE,
+    AGENT_CONTAINER_TTL_SECONDS,
+    BLOB_STORE_PATH,
+    BLOB_SWEEP_GRACE_SECONDS,
+    BLOB_SWEEP_INTERVAL_SECONDS,
+    DATABASE_URL,
+    DB_ENGINE_PROFILE,
+    DB_ENGINE_PROFILES,
+    DB_POOL_OPTIONS,
+    DEFAULT_CONTEXT_BUDGET,
+    DOCTOR_CONTEXT_BUDGET,
+    IMAGE_ANALYSIS_MAX_TOKENS,
+    IMAGE_CACHE_MAX_ENTRIES,
+    IMAGE_CACHE_MEMORY_BYTES,
+    IMAGE_PROCESSING_CONCURRENCY,
+    IMAGE_INTERPRETATOR_MODEL,
+    IMAGE_INTERPRETATOR_PROMPT,
+    LLM_PROMPT_CACHE_MODEL_PREFIXES,
+    MEDICAL_ASSISTANT_CONTEXT_BUDGET,
+    PATIENT_DATA_BUDGET_SHARE,
+    SWARM_DEBUG,
+    SUMMARY_KEEP_RECENT_MESSAGES,
+    SUMMARY_MODEL,
+    SUMMARY_PROMPT,
+    SUMMARY_TRIGGER_MESSAGES
+)
 from db.models import Image, MedicalRecord, Message, Session, User
-from flask import Flask, request, jsonify
-from agents import AgentContainer
+from quart import Quart, g, request, jsonify, make_response
+from agents import (
+    AgentContainer,
+    AgentContainerCache,
+    AsyncSwarm,
+    ContextBuilder,
+    ConversationSummarizer,
+    UserTurnQueue
+)
+from db.blob_store import BlobStore
 from db.database import DatabaseManager
-from swarm import Swarm
+from db.interpretation_cache import InterpretationCache
+from llm_transport import build_llm_transport, llm_timeout
+from logging_setup import LogPayload, configure_logging
+from metrics import (
+    LLM_CALL_SECONDS,
+    REQUEST_SECONDS,
+    new_request_id,
+    record_llm_usage,
+    request_id_var,
+    stage_timer
+)
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from datetime import datetime, UTC
-import threading
+import asyncio
+import base64
+import binascii
+import json
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI
 import logging
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import hashlib
 import httpx
+import time
 
 import logging
 
 # Configure logging once, at the module level
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('medical_app.log'),
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
 logger = logging.getLogger(__name__)
-app = Flask(__name__)
+app = Quart(__name__)
+
+@app.before_request
+async def start_request():
+    # Reuse the caller's request ID (the Telegram bot sends one) so logs line up
+    request_id_var.set(request.headers.get('X-Request-ID') or new_request_id())
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def finish_request(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    if request.endpoint != 'metrics':
+        REQUEST_SECONDS.labels(request.endpoint or 'unknown', response.status_code).observe(
+            time.perf_counter() - g.request_started
+        )
+    return response
 
 # Initialize database manager
-db_manager = DatabaseManager('sqlite:///medical_app.db')
+db_manager = DatabaseManager(
+    DATABASE_URL,
+    blob_store=BlobStore(BLOB_STORE_PATH),
+    profile=DB_ENGINE_PROFILES[DB_ENGINE_PROFILE],
+    pool_options=DB_POOL_OPTIONS
+)
 db_manager.init_db()
 
-# Dictionary to store AgentContainer instances per user_id
-agent_containers = {}
-agent_lock = threading.Lock()
+# Bounded LRU/TTL cache of AgentContainer instances per user_id
+agent_containers = AgentContainerCache(
+    max_size=AGENT_CONTAINER_CACHE_SIZE,
+    ttl_seconds=AGENT_CONTAINER_TTL_SECONDS
+)
 
-# Create HTTP client with proxy configuration
-http_client = httpx.Client(
-    transport=httpx.HTTPTransport(
-        proxy=httpx.Proxy(
-            url="socks5://127.0.0.1:1080",
-        )
-    )
+# Cache of image interpretations keyed by image content, model and prompt
+interpretation_cache = InterpretationCache(
+    db_manager,
+    memory_max_bytes=IMAGE_CACHE_MEMORY_BYTES,
+    max_entries=IMAGE_CACHE_MAX_ENTRIES
 )
+# Changing the prompt invalidates cached interpretations automatically
+IMAGE_INTERPRETATOR_PROMPT_VERSION = hashlib.sha256(
+    IMAGE_INTERPRETATOR_PROMPT.encode('utf-8')
+).hexdigest()[:16]
+
+# Shared, pooled HTTP client for every LLM call (swarm and image interpretation)
+llm_transport = build_llm_transport()
+http_client = httpx.AsyncClient(transport=llm_transport, timeout=llm_timeout())
 
-client = OpenAI(
+client = AsyncOpenAI(
     base_url=os.environ.get("OPENROUTER_BASE_URL"),
     api_key=os.environ.get("OPENROUTER_API_KEY"),
-    http_client=http_client
+    http_client=http_client,
+    timeout=llm_timeout(),
+    # Retries and backoff are handled by llm_transport
+    max_retries=0
 )
 
-swarm = Swarm()
-swarm.client = client
+swarm = AsyncSwarm(client=client, cache_control_prefixes=LLM_PROMPT_CACHE_MODEL_PREFIXES)
 
-MESSAGE_BUFFER_SIZE = 10  # or whatever size you want
+# Serializes turns per user and coalesces messages that arrive mid-turn
+turn_queue = UserTurnQueue()
 
-def get_agent_container(external_user_id: str) -> AgentContainer:
-    """Get or create AgentContainer for user"""
-    logger.info(f"Getting agent container for user: {external_user_id}")
+# Fits patient data and history into each agent's prompt token budget
+context_builder = ContextBuilder(
+    budgets={
+        "Medical Assistant": MEDICAL_ASSISTANT_CONTEXT_BUDGET,
+        "Doctor": DOCTOR_CONTEXT_BUDGET
+    },
+    default_budget=DEFAULT_CONTEXT_BUDGET,
+    patient_data_share=PATIENT_DATA_BUDGET_SHARE,
+    image_analysis_max_tokens=IMAGE_ANALYSIS_MAX_TOKENS
+)
 
-    with agent_lock:
-        logger.info("Acquired agent_lock")
-        try:
-            if external_user_id not in agent_containers:
-                logger.info("Creating new AgentContainer")
-                agent_containers[external_user_id] = AgentContainer(external_user_id, db_manager)
-                logger.info("Created new AgentContainer")
-            else:
-                logger.info("Using existing AgentContainer")
+# Folds older messages into a per-session summary in the background
+summarizer = ConversationSummarizer(
+    client,
+    model=SUMMARY_MODEL,
+    prompt=SUMMARY_PROMPT,
+    trigger_messages=SUMMARY_TRIGGER_MESSAGES,
+    keep_recent=SUMMARY_KEEP_RECENT_MESSAGES
+)
 
-            return agent_containers[external_user_id]
-        except Exception as e:
-            logger.error(f"Error in get_agent_container: {str(e)}")
-            raise
+def get_agent_container(external_user_id: str, pin: bool = False) -> AgentContainer:
+    """Get or create AgentContainer for user; with pin, release it with agent_containers.unpin"""
+    logger.info("Getting agent container for user: %s", external_user_id)
 
-def get_patient_data_context(db_accessor_agent) -> str:
-    """Helper function to format patient data context"""
-    medical_history = db_accessor_agent.get_medical_history()
-    return f"Patient Data:\n{medical_history}"
+    def create_container():
+        logger.info("Creating new AgentContainer")
+        agent_container = AgentContainer(external_user_id, db_manager)
+        logger.info("Created new AgentContainer")
+        return agent_container
 
-def process_single_image(image_data: str) -> str:
-    """Process image using OpenAI client"""
     try:
-        response = client.chat.completions.create(
-            model=IMAGE_INTERPRETATOR_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": IMAGE_INTERPRETATOR_PROMPT
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                        }
-                    ]
-                }
-            ]
+        # Only the cache bookkeeping is locked; construction (DB I/O) runs
+        # outside it and is shared by concurrent first requests for this user
+        with stage_timer('container_lookup'):
+            return agent_containers.get_or_create(external_user_id, create_container, pin=pin)
+    except Exception as e:
+        logger.error("Error in get_agent_container: %s", e)
+        raise
+
+def load_conversation(agent_container, agent, user_messages: List[Dict]) -> List[Dict]:
+    """Build the LLM message list for agent from the summary, history buffer and patient data"""
+    # The user messages are only persisted with the rest of the turn, so add them here
+    user_messages = [
+        {"role": user_message["role"], "content": user_message["content"]}
+        for user_message in user_messages
+        if user_message["role"] != 'tool' and user_message["content"]
+    ]
+    # Messages covered by the summary are sent only through it
+    summary, summary_message_id = agent_container.summary
+    history = [
+        message for message in list(agent_container.message_history)
+        if message["id"] > summary_message_id
+    ]
+    with stage_timer('patient_context'):
+        patient_data = agent_container.db_accessor_agent.get_patient_data(
+            context_builder.prepare_patient_data
+        )
+    with stage_timer('context_build'):
+        return context_builder.build(
+            agent,
+            patient_data,
+            history,
+            user_messages,
+            summary=summary
+        )
+
+def persist_response(agent_container, current_agent, user_messages: List[Dict], response) -> List[Dict]:
+    """Save the whole turn in one transaction and apply any handoff, returning visible messages"""
+    response_messages = response.messages if response and response.messages else []
+    handoff_to = None
+    if response_messages and response.agent != current_agent:
+        handoff_to = response.agent.name
+
+    with stage_timer('turn_commit'):
+        agent_container.db_accessor_agent.save_turn(
+            agent_container.user_context['session_id'],
+            user_messages,
+            response_messages,
+            agent_name=current_agent.name,
+            handoff_to=handoff_to
+        )
+
+    # Update the agent in the container; save_turn persisted it on the session
+    if handoff_to:
+        agent_container.current_agent = response.agent
+
+    # Only return visible messages
+    return [
+        {
+            'role': msg.get('role', 'assistant'),
+            'content': msg.get('content')
+        }
+        for msg in response_messages
+        if msg.get('role') != 'tool' and msg.get('content')
+    ]
+
+async def save_unanswered_messages(agent_container, user_messages: List[Dict]) -> None:
+    """Persist the user messages of a turn that failed before they could be saved"""
+    try:
+        await asyncio.to_thread(
+            agent_container.db_accessor_agent.save_turn,
+            agent_container.user_context['session_id'],
+            user_messages,
+            []
+        )
+    except Exception as e:
+        logger.error("Error saving unanswered messages: %s", e)
+
+def clear_user(external_user_id: str) -> bool:
+    """Delete all data for a user, returning False if the user is unknown"""
+    with db_manager.get_db_session(write=True) as session:
+        # Find user
+        user = session.query(User).filter_by(external_id=external_user_id).first()
+        if not user:
+            return False
+
+        # Delete all related data
+        session.query(Message).filter(
+            Message.session_id.in_(
+                session.query(Session.id).filter_by(user_id=user.id)
+            )
+        ).delete(synchronize_session=False)
+
+        # Blobs are shared by content hash; the periodic sweep removes unreferenced ones
+        session.query(Image).filter(
+            Image.session_id.in_(
+                session.query(Session.id).filter_by(user_id=user.id)
+            )
+        ).delete(synchronize_session=False)
+
+        session.query(Session).filter_by(user_id=user.id).delete()
+        session.query(MedicalRecord).filter_by(user_id=user.id).delete()
+
+        # Remove from active containers and drop state cached on them
+        agent_container = agent_containers.pop(external_user_id)
+        if agent_container is not None:
+            agent_container.message_history.clear()
+            agent_container.summary = (None, 0)
+            agent_container.db_accessor_agent.invalidate_medical_history()
+
+    return True
+
+def interpretation_cache_key(content_hash: str) -> str:
+    """Combine the image content hash with the model and prompt version"""
+    digest = hashlib.sha256(content_hash.encode('utf-8'))
+    digest.update(IMAGE_INTERPRETATOR_MODEL.encode('utf-8'))
+    digest.update(IMAGE_INTERPRETATOR_PROMPT_VERSION.encode('utf-8'))
+    return digest.hexdigest()
+
+async def interpret_image(image_bytes: bytes, mime_type: str) -> str:
+    """Interpret an image, reusing a cached result for identical content"""
+    cache_key = interpretation_cache_key(BlobStore.content_hash(image_bytes))
+    with stage_timer('interpretation_cache'):
+        interpretation = await asyncio.to_thread(interpretation_cache.get, cache_key)
+    if interpretation is not None:
+        return interpretation
+
+    interpretation = await process_single_image(image_bytes, mime_type)
+    if interpretation:
+        await asyncio.to_thread(
+            interpretation_cache.put,
+            cache_key,
+            IMAGE_INTERPRETATOR_MODEL,
+            IMAGE_INTERPRETATOR_PROMPT_VERSION,
+            interpretation
         )
+    return interpretation
+
+async def process_single_image(image_bytes: bytes, mime_type: str = 'image/jpeg') -> str:
+    """Process image using OpenAI client"""
+    # Base64 is produced only here, when building the data URL for the LLM
+    image_url = f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+    try:
+        with LLM_CALL_SECONDS.labels(IMAGE_INTERPRETATOR_MODEL, 'false').time():
+            response = await client.chat.completions.create(
+                model=IMAGE_INTERPRETATOR_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": IMAGE_INTERPRETATOR_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": image_url}
+                            }
+                        ]
+                    }
+                ]
+            )
+        record_llm_usage(IMAGE_INTERPRETATOR_MODEL, response.usage)
 
         # Add debug logging
-        logger.debug(f"OpenRouter API response: {response}")
+        logger.debug("OpenRouter API response: %s", LogPayload(response))
 
         try:
             return response.choices[0].message.content
         except (AttributeError, IndexError) as e:
-            logger.error(f"Unexpected response structure. Response: {response}")
-            logger.error(f"Error: {e}")
+            logger.error("Unexpected response structure (%s): %s", e, LogPayload(response))
             return None
 
     except Exception as e:
-        logger.error(f"Error in image processing: {str(e)}")
-        logger.error(f"Full exception: {traceback.format_exc()}")
+        logger.error("Error in image processing: %s", e, exc_info=True)
         return None
 
+async def process_image_batch(external_user_id: str, images: List[Tuple[bytes, str]]):
+    """Interpret and store (image_bytes, mime_type) pairs, returning the route response"""
+    try:
+        # Pinned so the commit below updates the records of the cached container
+        agent_container = await asyncio.to_thread(get_agent_container, external_user_id, True)
+        try:
+            # Interpret all images concurrently, capped per request
+            semaphore = asyncio.Semaphore(IMAGE_PROCESSING_CONCURRENCY)
+
+            async def interpret(image_bytes, mime_type):
+                async with semaphore:
+                    return await interpret_image(image_bytes, mime_type)
+
+            # gather keeps results in input order
+            results = await asyncio.gather(*(interpret(*image) for image in images))
+
+            # Save images, interpretations and medical records in one transaction
+            with stage_timer('image_commit'):
+                await asyncio.to_thread(
+                    agent_container.db_accessor_agent.save_processed_images,
+                    agent_container.user_context['session_id'],
+                    [
+                        (image_bytes, mime_type, interpretation)
+                        for (image_bytes, mime_type), interpretation in zip(images, results)
+                    ]
+                )
+
+            interpretations = [interpretation for interpretation in results if interpretation]
+
+            # Generate response
+            response_message = {
+                'role': 'assistant',
+                'content': "Интерпретация изображения: " +
+                          ("".join(interpretations) if interpretations
+                           else "В изображениях не обнаружено значимой медицинской информации.")
+            }
+
+            # Save assistant's response
+            await asyncio.to_thread(
+                agent_container.db_accessor_agent.save_message,
+                agent_container.user_context['session_id'],
+                response_message['role'],
+                response_message['content'],
+                visible_to_user=True,
+                message_metadata={
+                    'timestamp': datetime.now(UTC).isoformat()
+                }
+            )
+
+            return jsonify({
+                'response': [response_message]
+            }), 200
+        finally:
+            agent_containers.unpin(external_user_id)
+
+    except Exception as e:
+        logger.error("Error processing images: %s", e)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/process_images', methods=['POST'])
-def process_images():
-    data = request.get_json()
+async def process_images():
+    data = await request.get_json()
     external_user_id = data.get('user_id')
     images = data.get('images', [])
 
@@ -128,181 +405,200 @@ def process_images():
         return jsonify({'error': 'user_id and images are required'}), 400
 
     try:
-        agent_container = get_agent_container(external_user_id)
-        interpretations = []
+        images = [(base64.b64decode(image_data, validate=True), 'image/jpeg') for image_data in images]
+    except (binascii.Error, TypeError) as e:
+        return jsonify({'error': f'images must be base64 encoded: {str(e)}'}), 400
 
-        for image_data in images:
-            # Save image to database
-            image_record = agent_container.db_accessor_agent.save_image(
-                agent_container.user_context['session_id'],
-                image_data
-            )
+    return await process_image_batch(external_user_id, images)
 
-            # Get medical interpretation
-            interpretation = process_single_image(image_data)
+@app.route('/process_images/upload', methods=['POST'])
+async def upload_images():
+    """Binary variant of /process_images: multipart form with user_id and raw image files"""
+    form = await request.form
+    files = await request.files
+    external_user_id = form.get('user_id')
+    uploads = files.getlist('images')
 
-            if interpretation:
-                # Save interpretation
-                agent_container.db_accessor_agent.save_image_interpretation(
-                    image_record['image_id'],
-                    interpretation
-                )
+    if not external_user_id or not uploads:
+        return jsonify({'error': 'user_id and images are required'}), 400
 
-                # Update medical record if interpretation contains medical info
-                agent_container.db_accessor_agent.update_medical_record(
-                    f"image_analysis_{image_record['image_id']}",
-                    interpretation
-                )
+    images = []
+    for upload in uploads:
+        mime_type = upload.mimetype or 'image/jpeg'
+        if not mime_type.startswith('image/'):
+            return jsonify({'error': f'unsupported content type {mime_type}'}), 400
+        # Raw bytes are stored as-is; base64 is only produced for the LLM request
+        images.append((upload.read(), mime_type))
+
+    return await process_image_batch(external_user_id, images)
+
+def normalize_message(message) -> Dict:
+    if isinstance(message, str):
+        return {"role": "user", "content": message}
+    return message
+
+async def run_queued_turn(external_user_id: str, user_messages: List[Dict], on_event=None) -> List[Dict]:
+    """Run a turn queued for a user on the user's cached container.
+
+    The container is looked up when the turn starts and pinned until it ends,
+    so the turn cannot write its messages or handoff into a container that
+    was evicted meanwhile and rebuilt by a newer request.
+    """
+    agent_container = await asyncio.to_thread(get_agent_container, external_user_id, True)
+    try:
+        return await run_turn(agent_container, user_messages, on_event)
+    finally:
+        agent_containers.unpin(external_user_id)
 
-                interpretations.append(interpretation)
+async def run_turn(agent_container, user_messages: List[Dict], on_event=None) -> List[Dict]:
+    """Run one agent turn over the queued user messages and persist it.
 
-        # Generate response
-        response_message = {
-            'role': 'assistant',
-            'content': "Интерпретация изображения: " +
-                      ("".join(interpretations) if interpretations
-                       else "В изображениях не обнаружено значимой медицинской информации.")
-        }
+    With on_event, the turn is streamed and on_event(event, data) is awaited
+    for every token, message end and handoff. Returns the visible messages.
+    """
+    try:
+        # Get current agent
+        current_agent = agent_container.current_agent
 
-        # Save assistant's response
-        agent_container.db_accessor_agent.save_message(
-            agent_container.user_context['session_id'],
-            response_message['role'],
-            response_message['content'],
-            visible_to_user=True,
-            message_metadata={
-                'timestamp': datetime.now(UTC).isoformat()
-            }
+        messages = await asyncio.to_thread(load_conversation, agent_container, current_agent, user_messages)
+        logger.debug("Sending messages to LLM: %s", LogPayload(messages))
+
+        # Run conversation
+        if on_event is None:
+            response = await swarm.run(
+                agent=current_agent,
+                messages=messages,
+                debug=SWARM_DEBUG
+            )
+        else:
+            response = None
+            async for chunk in swarm.run_and_stream(
+                agent=current_agent,
+                messages=messages,
+                debug=SWARM_DEBUG
+            ):
+                if 'response' in chunk:
+                    response = chunk['response']
+                elif 'handoff' in chunk:
+                    await on_event('handoff', chunk['handoff'])
+                elif chunk.get('delim') == 'end':
+                    await on_event('message_end', {})
+                elif chunk.get('content'):
+                    await on_event('token', {'content': chunk['content']})
+
+        # Handle response and save the whole turn
+        visible_messages = await asyncio.to_thread(
+            persist_response, agent_container, current_agent, user_messages, response
         )
 
-        return jsonify({
-            'response': [response_message]
-        }), 200
+    except Exception:
+        await save_unanswered_messages(agent_container, user_messages)
+        raise
 
+    # The turn is saved; a summarizer failure must not save it again or fail the reply
+    try:
+        summarizer.maybe_schedule(agent_container)
     except Exception as e:
-        logger.error(f"Error processing images: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error scheduling conversation summary: %s", e)
+    return visible_messages
+
+def format_sse(event: str, data: Dict) -> str:
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 @app.route('/message', methods=['POST'])
-def handle_message():
-    data = request.get_json()
+async def handle_message():
+    """Run an agent turn for the user's message.
+
+    Turns are serialized per user. Messages arriving while a turn is in
+    flight are answered together in the next turn: the request carrying the
+    last of them gets the reply, the others return an empty response with
+    "coalesced": true.
+    """
+    data = await request.get_json()
     external_user_id = data.get('user_id')
     message = data.get('message')
 
     if not external_user_id or not message:
         return jsonify({'error': 'user_id and message are required'}), 400
 
-    agent_container = get_agent_container(external_user_id)
-
     try:
-        # First save the user's message
-        if isinstance(message, str):
-            message = {"role": "user", "content": message}
-
-        # Save user message to DB
-        agent_container.db_accessor_agent.save_message(
-            agent_container.user_context['session_id'],
-            message["role"],
-            message["content"],
-            visible_to_user=True,
-            message_metadata={
-                'timestamp': datetime.now(UTC).isoformat()
-            }
+        visible_messages, answered_here = await turn_queue.submit(
+            external_user_id,
+            normalize_message(message),
+            lambda user_messages: run_queued_turn(external_user_id, user_messages)
         )
 
-        # Get recent message history including the just-saved message
-        with agent_container.db_accessor_agent.db_manager.get_db_session() as session:
-            recent_messages = session.query(Message).filter(
-                Message.session_id == agent_container.user_context['session_id'],
-                Message.visible_to_user == True,
-                Message.role != 'tool',
-                Message.content.isnot(None),
-                Message.content != ''
-            ).order_by(
-                Message.created_at.desc()
-            ).limit(MESSAGE_BUFFER_SIZE).all()
-
-            # Convert to format for swarm excluding tool messages
-            conversation_messages = [
-                {"role": msg.role, "content": msg.content}
-                for msg in reversed(recent_messages)  # Reverse to get chronological order
-            ]
-
-        # Get patient data context and prepend as system message
-        patient_data_context = get_patient_data_context(agent_container.db_accessor_agent)
-        messages = [{"role": "system", "content": patient_data_context}] + conversation_messages
-
-        logger.debug(f"Sending messages to LLM: {messages}")
+        if not answered_here:
+            return jsonify({'response': [], 'coalesced': True}), 200
+        return jsonify({'response': visible_messages}), 200
 
-        # Get current agent
-        current_agent = agent_container.current_agent
+    except Exception as e:
+        logger.error("Error processing message: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
 
-        # Run conversation
-        response = swarm.run(
-            agent=current_agent,
-            messages=messages,
-            stream=False,
-            debug=True
-        )
+@app.route('/message/stream', methods=['POST'])
+async def handle_message_stream():
+    """Same as /message, but streams tokens and handoffs as server-sent events.
 
-        # Handle response and save ALL messages
-        visible_messages = []
-        if response and response.messages:
-            for msg in response.messages:
-                # Save ALL messages to DB including tool messages
-                visible_to_user = msg.get('role') != 'tool'
-                agent_container.db_accessor_agent.save_message(
-                    agent_container.user_context['session_id'],
-                    msg.get('role', 'assistant'),
-                    msg.get('content', ''),
-                    visible_to_user=visible_to_user,
-                    message_metadata={
-                        'agent': current_agent.name,
-                        'timestamp': datetime.now(UTC).isoformat()
-                    }
-                )
+    Events: `token` ({"content"}), `message_end` after each assistant
+    completion, `handoff` ({"from", "to"}), then `done` with the same
+    payload /message returns, or `error`. Turns are queued and coalesced
+    like /message; a coalesced request only receives `done`.
+    """
+    data = await request.get_json()
+    external_user_id = data.get('user_id')
+    message = data.get('message')
 
-                # Only add visible messages to response
-                if visible_to_user and msg.get('content'):
-                    visible_messages.append({
-                        'role': msg.get('role', 'assistant'),
-                        'content': msg.get('content')
-                    })
-
-            # Handle agent handoff
-            if response and response.agent != current_agent:
-                handoff_message = {
-                    'role': 'assistant',
-                    'content': f"Transferring you to {response.agent.name}"
-                }
-                # Save handoff message
-                agent_container.db_accessor_agent.save_message(
-                    agent_container.user_context['session_id'],
-                    'assistant',
-                    handoff_message['content'],
-                    visible_to_user=False,
-                    message_metadata={
-                        'handoff_from': current_agent.name,
-                        'handoff_to': response.agent.name,
-                        'timestamp': datetime.now(UTC).isoformat()
-                    }
-                )
+    if not external_user_id or not message:
+        return jsonify({'error': 'user_id and message are required'}), 400
 
-                # Update the agent in the container
-                agent_container.current_agent = response.agent
+    event_queue = asyncio.Queue()
 
-        return jsonify({'response': visible_messages}), 200
+    async def on_event(event: str, payload: Dict) -> None:
+        await event_queue.put(format_sse(event, payload))
 
-    except Exception as e:
-        logger.error(f"Error processing message: {str(e.with_traceback)}")
-        return jsonify({'error': str(e)}), 500
+    async def submit_turn():
+        # Runs independently of the response so a disconnecting client
+        # does not abort a turn that other queued messages depend on
+        try:
+            visible_messages, answered_here = await turn_queue.submit(
+                external_user_id,
+                normalize_message(message),
+                lambda user_messages: run_queued_turn(external_user_id, user_messages, on_event)
+            )
+            if answered_here:
+                await on_event('done', {'response': visible_messages})
+            else:
+                await on_event('done', {'response': [], 'coalesced': True})
+        except Exception as e:
+            logger.error("Error streaming message: %s", e, exc_info=True)
+            await on_event('error', {'error': str(e)})
+        finally:
+            await event_queue.put(None)
+
+    turn_task = asyncio.create_task(submit_turn())
+
+    async def events():
+        while (event := await event_queue.get()) is not None:
+            yield event
+        await turn_task
+
+    response = await make_response(events(), 200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # RESPONSE_TIMEOUT would cut off turns that stream for longer than it
+    response.timeout = None
+    return response
 
 @app.route('/initialize', methods=['POST'])
-def initialize_user():
-    data = request.get_json()
+async def initialize_user():
+    data = await request.get_json()
     external_user_id = data.get('user_id')
 
-    logger.info(f"Initializing user: {external_user_id}")
+    logger.info("Initializing user: %s", external_user_id)
 
     if not external_user_id:
         logger.error("No user_id provided")
@@ -310,7 +606,7 @@ def initialize_user():
 
     try:
         logger.info("Getting agent container")
-        agent_container = get_agent_container(external_user_id)
+        agent_container = await asyncio.to_thread(get_agent_container, external_user_id)
         logger.info("Got agent container")
 
         return jsonify({
@@ -320,45 +616,21 @@ def initialize_user():
         }), 200
 
     except Exception as e:
-        logger.error(f"Error initializing user: {str(e)}", exc_info=True)  # Added exc_info for stack trace
+        logger.error("Error initializing user: %s", e, exc_info=True)  # Added exc_info for stack trace
         return jsonify({'error': str(e)}), 500
 
 @app.route('/clear', methods=['POST'])
-def clear_user_data():
+async def clear_user_data():
     """Clear all user data and start fresh"""
-    data = request.get_json()
+    data = await request.get_json()
     external_user_id = data.get('user_id')
 
     if not external_user_id:
         return jsonify({'error': 'user_id is required'}), 400
 
     try:
-        with db_manager.get_db_session() as session:
-            # Find user
-            user = session.query(User).filter_by(external_id=external_user_id).first()
-            if not user:
-                return jsonify({'status': 'success', 'message': 'No data to clear'}), 200
-
-            # Delete all related data
-            session.query(Message).filter(
-                Message.session_id.in_(
-                    session.query(Session.id).filter_by(user_id=user.id)
-                )
-            ).delete(synchronize_session=False)
-
-            session.query(Image).filter(
-                Image.session_id.in_(
-                    session.query(Session.id).filter_by(user_id=user.id)
-                )
-            ).delete(synchronize_session=False)
-
-            session.query(Session).filter_by(user_id=user.id).delete()
-            session.query(MedicalRecord).filter_by(user_id=user.id).delete()
-
-            # Remove from active containers
-            with agent_lock:
-                if external_user_id in agent_containers:
-                    del agent_containers[external_user_id]
+        if not await asyncio.to_thread(clear_user, external_user_id):
+            return jsonify({'status': 'success', 'message': 'No data to clear'}), 200
 
         return jsonify({
             'status': 'success',
@@ -366,9 +638,58 @@ def clear_user_data():
         }), 200
 
     except Exception as e:
-        logger.error(f"Error clearing user data: {str(e)}")
+        logger.error("Error clearing user data: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/stats', methods=['GET'])
+async def stats():
+    """Expose cache counters for capacity planning"""
+    return jsonify({
+        'agent_containers': agent_containers.stats(),
+        'turn_queue': turn_queue.stats(),
+        'context': context_builder.stats(),
+        'summarizer': summarizer.stats(),
+        'image_interpretations': interpretation_cache.stats(),
+        'llm_transport': llm_transport.stats(),
+        'llm_usage': swarm.usage_stats()
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus metrics: request, stage, LLM and tool call latencies"""
+    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """Database connectivity and connection pool usage"""
+    try:
+        await asyncio.to_thread(db_manager.ping)
+        status, code = 'ok', 200
+    except Exception as e:
+        logger.error("Health check failed: %s", e)
+        status, code = 'unavailable', 503
+
+    return jsonify({
+        'status': status,
+        'database': db_manager.pool_stats()
+    }), code
+
+async def sweep_blobs_periodically():
+    while True:
+        await asyncio.sleep(BLOB_SWEEP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(db_manager.sweep_blobs, BLOB_SWEEP_GRACE_SECONDS)
+        except Exception as e:
+            logger.error("Error sweeping blobs: %s", e)
+
+@app.before_serving
+async def start_blob_sweep():
+    app.blob_sweep_task = asyncio.create_task(sweep_blobs_periodically())
+
+@app.after_serving
+async def stop_blob_sweep():
+    app.blob_sweep_task.cancel()
+
 if __name__ == '__main__':
     # Ensure database tables are created
     db_manager.init_db()
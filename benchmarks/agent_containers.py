@@ -0,0 +1,102 @@
+"""Memory and construction time of many AgentContainers.
+
+Users and their active sessions are bulk-inserted into a fresh SQLite
+database first, so the timed part is what a cache miss costs: the session
+lookup, the history query and binding the agent templates. Construction is
+timed over --containers containers (default 100k), all kept alive; memory per
+container is measured with tracemalloc over a --sample of further containers,
+since tracing slows construction down.
+
+When swarm is not installed, a stand-in for swarm.Agent (a pydantic model
+with the same fields) is used, so per-container agent copies cost about the
+same as the real ones.
+
+    python benchmarks/agent_containers.py --containers 100000
+"""
+import argparse
+import importlib.util
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from typing import Callable, List, Optional, Union
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SWARM_STAND_IN = importlib.util.find_spec('swarm') is None
+if SWARM_STAND_IN:
+    from pydantic import BaseModel
+
+    class Agent(BaseModel):
+        name: str = "Agent"
+        model: str = "gpt-4o"
+        instructions: Union[str, Callable[[], str]] = "You are a helpful agent."
+        functions: List[Callable] = []
+        tool_choice: Optional[str] = None
+        parallel_tool_calls: bool = True
+
+    sys.modules['swarm'] = types.SimpleNamespace(Agent=Agent)
+    # agents/__init__.py imports the swarm runner too; load only the modules needed here
+    agents_package = types.ModuleType('agents')
+    agents_package.__path__ = [str(ROOT / 'agents')]
+    sys.modules['agents'] = agents_package
+
+from agents.agent_container import AgentContainer
+from config import DB_ENGINE_PROFILES
+from db.database import DatabaseManager
+from db.models import Session, User
+from sqlalchemy import insert
+
+def create_users(db_manager: DatabaseManager, count: int) -> None:
+    with db_manager.get_db_session(write=True) as session:
+        user_ids = session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [{"external_id": f"user-{n}"} for n in range(count)]
+        ).scalars().all()
+        session.execute(insert(Session), [
+            {"user_id": user_id, "is_active": True, "current_agent": "Medical Assistant"}
+            for user_id in user_ids
+        ])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--containers', type=int, default=100000)
+    parser.add_argument('--sample', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_manager = DatabaseManager(
+            f"sqlite:///{os.path.join(directory, 'medical_app.db')}",
+            profile=DB_ENGINE_PROFILES['production']
+        )
+        db_manager.init_db()
+        create_users(db_manager, args.containers + args.sample)
+
+        containers = []
+        started = time.perf_counter()
+        for n in range(args.containers):
+            containers.append(AgentContainer(f"user-{n}", db_manager))
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        sample = [
+            AgentContainer(f"user-{n}", db_manager)
+            for n in range(args.containers, args.containers + args.sample)
+        ]
+        traced = tracemalloc.get_traced_memory()[0] - traced_before
+        tracemalloc.stop()
+        db_manager.engine.dispose()
+
+    print(f"agent class:           {'stand-in' if SWARM_STAND_IN else 'swarm.Agent'}")
+    print(f"containers:            {len(containers)}")
+    print(f"construction:          {elapsed / len(containers) * 1000:.3f} ms/container, {elapsed:.1f} s total")
+    print(f"memory:                {traced / len(sample) / 1024:.2f} KiB/container (traced over {len(sample)})")
+    print(f"estimated total:       {traced / len(sample) * len(containers) / 2 ** 20:.1f} MiB")
+
+if __name__ == '__main__':
+    main()
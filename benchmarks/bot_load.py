@@ -0,0 +1,188 @@
+"""Load test of the Telegram bot's API client against a fake local server.
+
+Many chats send a message at once. Each goes through
+TelegramAgentBot.send_message, which streams /message/stream from a local
+server that emits SSE tokens over a configurable turn latency, so no LLM or
+Telegram access is needed. Reports wall time, per-chat latency percentiles
+and the peak number of concurrent server requests. With --blocking-baseline
+the same messages are also sent the way the bot did before its pooled async
+client: a blocking requests.post per message on the event loop.
+
+    python benchmarks/bot_load.py --chats 200 --latency 1.0
+"""
+import argparse
+import asyncio
+import json
+import pathlib
+import statistics
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'tg_bot'))
+
+import requests
+import telegram_bot
+
+TOKENS_PER_TURN = 20
+
+class FakeApiServer:
+    """Minimal HTTP/1.1 keep-alive server for /message and /message/stream.
+
+    Runs its own event loop on a thread, so a client that blocks its loop
+    (the blocking baseline) does not stall the server.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self._server = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self) -> str:
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle_connection, '127.0.0.1', 0), self._loop
+        ).result()
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._close_connections(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _close_connections(self):
+        self._server.close()
+        # Handlers of keep-alive connections return once the client has closed them
+        handlers = asyncio.all_tasks() - {asyncio.current_task()}
+        if handlers:
+            await asyncio.wait(handlers, timeout=5)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode('latin-1').split("\r\n")
+                headers = dict(line.split(": ", 1) for line in header_lines if line)
+                await reader.readexactly(int(headers.get('content-length', 0)))
+                path = request_line.split(" ")[1]
+
+                self.requests += 1
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                try:
+                    if path == '/message/stream':
+                        await self._stream_turn(writer)
+                    else:
+                        await asyncio.sleep(self.latency)
+                        body = json.dumps({'response': [{'role': 'assistant', 'content': 'ok'}]}).encode()
+                        writer.write(
+                            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                            + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                        )
+                        await writer.drain()
+                finally:
+                    self.in_flight -= 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream_turn(self, writer):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        events = [('token', {'content': f"token{n} "}) for n in range(TOKENS_PER_TURN)]
+        events += [
+            ('message_end', {}),
+            ('done', {'response': [{'role': 'assistant', 'content': 'done'}]})
+        ]
+        for event, data in events:
+            await asyncio.sleep(self.latency / len(events))
+            chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+class FakeMessage:
+    """Stands in for a telegram.Message: replies and edits are no-ops"""
+
+    async def reply_text(self, text):
+        return self
+
+    async def edit_text(self, text):
+        return self
+
+def fake_update(chat_id: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=chat_id),
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=FakeMessage()
+    )
+
+def report(name: str, wall: float, latencies, server: FakeApiServer) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<18} {wall:>8.2f} {statistics.median(latencies):>8.2f} {p95:>8.2f} "
+        f"{server.peak_in_flight:>10} {server.requests:>9}"
+    )
+
+async def run_bot(chats: int, latency: float) -> None:
+    server = FakeApiServer(latency)
+    telegram_bot.SERVER_URL = server.start()
+    bot = telegram_bot.TelegramAgentBot(token='benchmark')
+    await bot.post_init(None)
+
+    async def send(chat_id):
+        started = time.perf_counter()
+        await bot.send_message(fake_update(chat_id), None, "У меня болит голова")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(send(chat_id) for chat_id in range(chats)))
+    report('pooled async', time.perf_counter() - started, latencies, server)
+    await bot.http_client.aclose()
+    bot.image_preprocessor.shutdown()
+    server.stop()
+
+async def run_blocking(chats: int, latency: float) -> None:
+    server = FakeApiServer(latency)
+    url = server.start()
+
+    # requests.post inside the handler blocks the event loop, so all chats queue
+    # behind each other no matter how many updates are dispatched concurrently
+    async def send(chat_id, queued_at):
+        requests.post(
+            f"{url}/message",
+            json={'user_id': str(chat_id), 'message': {'role': 'user', 'content': 'hi'}},
+            timeout=300
+        )
+        return time.perf_counter() - queued_at
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(send(chat_id, started) for chat_id in range(chats)))
+    report('blocking requests', time.perf_counter() - started, latencies, server)
+    server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=1.0, help="Seconds per simulated agent turn")
+    parser.add_argument('--blocking-baseline', action='store_true', help="Takes about chats * latency seconds")
+    args = parser.parse_args()
+
+    print(f"{'client':<18} {'wall s':>8} {'p50 s':>8} {'p95 s':>8} {'peak conc':>10} {'requests':>9}")
+    asyncio.run(run_bot(args.chats, args.latency))
+    if args.blocking_baseline:
+        asyncio.run(run_blocking(args.chats, args.latency))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Photo preprocessing time on representative photo sizes.
+
+Times preprocess_photo per decode mode on synthetic camera-like JPEGs:
+Telegram's compressed photo (1280x960), a 5 MP and a 12 MP camera photo
+sent as a file. Then pushes an album of each size through ImagePreprocessor
+with a process and a thread pool.
+
+    python benchmarks/photo_preprocessing.py --repeats 10
+"""
+import argparse
+import asyncio
+import pathlib
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'tg_bot'))
+
+from PIL import Image, ImageDraw, ImageFilter
+from image_preprocessing import ImagePreprocessor, preprocess_photo
+
+PHOTO_SIZES = [(1280, 960), (2592, 1944), (4000, 3000)]
+# (name, preprocess_photo keyword arguments)
+MODES = [
+    ('full decode', {'use_draft': False}),
+    ('draft', {'use_draft': True}),
+    ('draft + gap 3.0', {'use_draft': True, 'reducing_gap': 3.0}),
+]
+ALBUM_SIZE = 10
+
+def synthetic_photo(width: int, height: int) -> bytes:
+    """JPEG with gradients, shapes and sensor-like noise, compressed like a phone camera"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), gradient.rotate(45)))
+    draw = ImageDraw.Draw(img)
+    for n in range(40):
+        x, y = (n * 7919) % width, (n * 104729) % height
+        draw.ellipse((x, y, x + width // 8, y + height // 8), fill=((n * 50) % 256, (n * 90) % 256, (n * 130) % 256))
+    img = img.filter(ImageFilter.GaussianBlur(2))
+    noise = Image.effect_noise((width, height), 24).convert('RGB')
+    img = Image.blend(img, noise, 0.15)
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+def time_mode(photo: bytes, options: dict, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        preprocess_photo(photo, **options)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+async def time_album(photo: bytes, executor: str) -> float:
+    preprocessor = ImagePreprocessor(executor=executor, max_pending=ALBUM_SIZE)
+    try:
+        # Warm up the pool so worker start-up is not counted
+        await preprocessor.preprocess(photo)
+        started = time.perf_counter()
+        await asyncio.gather(*(preprocessor.preprocess(photo) for _ in range(ALBUM_SIZE)))
+        return time.perf_counter() - started
+    finally:
+        preprocessor.executor.shutdown(wait=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    photos = {size: synthetic_photo(*size) for size in PHOTO_SIZES}
+
+    print(f"{'photo':<11} {'input KiB':>9} " + " ".join(f"{name + ' ms':>20}" for name, _ in MODES))
+    for (width, height), photo in photos.items():
+        timings = [time_mode(photo, options, args.repeats) * 1000 for _, options in MODES]
+        print(f"{width}x{height:<6} {len(photo) / 1024:>9.0f} " + " ".join(f"{ms:>20.1f}" for ms in timings))
+
+    print()
+    print(f"{'album of ' + str(ALBUM_SIZE):<14} {'process pool ms':>16} {'thread pool ms':>16}")
+    for (width, height), photo in photos.items():
+        process_ms = asyncio.run(time_album(photo, 'process')) * 1000
+        thread_ms = asyncio.run(time_album(photo, 'thread')) * 1000
+        print(f"{width}x{height:<9} {process_ms:>16.1f} {thread_ms:>16.1f}")
+
+if __name__ == '__main__':
+    main()
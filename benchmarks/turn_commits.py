@@ -0,0 +1,101 @@
+"""Commits and time per agent turn: save_turn vs one save_message per message.
+
+Runs both ways of persisting a turn (user message, assistant tool call, tool
+result, final answer and a handoff) against a fresh SQLite database with the
+production engine profile, counting commits with an engine event listener.
+
+    python benchmarks/turn_commits.py --turns 500
+"""
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from agents.db_agent import DBAccessorAgent
+from config import DB_ENGINE_PROFILES
+from db.database import DatabaseManager
+from db.models import Session, User
+from sqlalchemy import event
+
+USER_MESSAGES = [{"role": "user", "content": "У меня болит голова третий день"}]
+RESPONSE_MESSAGES = [
+    {"role": "assistant", "content": ""},
+    {"role": "tool", "content": "Record updated"},
+    {"role": "assistant", "content": "Записал. Передаю вас врачу."},
+]
+HANDOFF_TO = "Doctor"
+
+def new_db_accessor_agent(directory: str) -> DBAccessorAgent:
+    db_manager = DatabaseManager(
+        f"sqlite:///{os.path.join(directory, 'medical_app.db')}",
+        profile=DB_ENGINE_PROFILES['production']
+    )
+    db_manager.init_db()
+    with db_manager.get_db_session(write=True) as session:
+        user = User(external_id='benchmark')
+        session.add(user)
+        session.flush()
+        active_session = Session(user_id=user.id, is_active=True, current_agent="Medical Assistant")
+        session.add(active_session)
+        session.flush()
+        user_context = {"user_id": user.id, "session_id": active_session.id}
+    return DBAccessorAgent(db_manager, user_context)
+
+def save_per_message(db_accessor_agent: DBAccessorAgent, session_id: int) -> None:
+    """How turns were persisted before save_turn"""
+    for message in USER_MESSAGES:
+        db_accessor_agent.save_message(session_id, message["role"], message["content"])
+    for message in RESPONSE_MESSAGES:
+        db_accessor_agent.save_message(
+            session_id,
+            message["role"],
+            message["content"],
+            visible_to_user=message["role"] != 'tool'
+        )
+    db_accessor_agent.save_message(session_id, "assistant", f"Transferring you to {HANDOFF_TO}", visible_to_user=False)
+    with db_accessor_agent.db_manager.get_db_session(write=True) as session:
+        session.query(Session).filter_by(id=session_id).update({"current_agent": HANDOFF_TO})
+
+def save_whole_turn(db_accessor_agent: DBAccessorAgent, session_id: int) -> None:
+    db_accessor_agent.save_turn(
+        session_id,
+        USER_MESSAGES,
+        RESPONSE_MESSAGES,
+        agent_name="Medical Assistant",
+        handoff_to=HANDOFF_TO
+    )
+
+def run(name: str, save, turns: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        db_accessor_agent = new_db_accessor_agent(directory)
+        session_id = db_accessor_agent.user_context['session_id']
+        commits = 0
+
+        def count_commit(conn):
+            nonlocal commits
+            commits += 1
+
+        event.listen(db_accessor_agent.db_manager.engine, 'commit', count_commit)
+        started = time.perf_counter()
+        for _ in range(turns):
+            save(db_accessor_agent, session_id)
+        elapsed = time.perf_counter() - started
+        db_accessor_agent.db_manager.engine.dispose()
+
+    print(f"{name:<16} {commits / turns:>12.1f} {elapsed / turns * 1000:>12.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'persistence':<16} {'commits/turn':>12} {'ms/turn':>12}")
+    run('save_message', save_per_message, args.turns)
+    run('save_turn', save_whole_turn, args.turns)
+
+if __name__ == '__main__':
+    main()
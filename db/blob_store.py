@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+import hashlib
+import mmap
+import os
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    """Content-addressed, deduplicated store for raw image bytes on disk.
+
+    Blobs are named by the sha256 of their content and sharded two levels
+    deep (<root>/ab/cd/abcd...) to keep directories small. A blob's mtime is
+    the time of its last put, so a sweep can spare blobs about to be referenced.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash)
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.exists(self.path(content_hash))
+
+    def put(self, data: bytes) -> str:
+        """Store bytes if not already present and return their content hash"""
+        content_hash = self.content_hash(data)
+        path = self.path(content_hash)
+        if os.path.exists(path):
+            try:
+                # Refresh the mtime so a concurrent sweep treats the blob as new
+                os.utime(path)
+                return content_hash
+            except FileNotFoundError:
+                pass  # Swept meanwhile, write it again
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename so readers never see partial blobs
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return content_hash
+
+    @contextmanager
+    def open(self, content_hash: str):
+        """Memory-map a blob read-only; yields a buffer usable without copying"""
+        with open(self.path(content_hash), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def read(self, content_hash: str) -> bytes:
+        with self.open(content_hash) as blob:
+            return bytes(blob)
+
+    def iter_blobs(self) -> Iterator[Tuple[str, float]]:
+        """Yield (content_hash, mtime) of every stored blob"""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if len(name) != 64:
+                    continue  # Temp file of a put in progress
+                try:
+                    yield name, os.stat(os.path.join(directory, name)).st_mtime
+                except FileNotFoundError:
+                    continue
+
+    def mtime(self, content_hash: str) -> Optional[float]:
+        try:
+            return os.stat(self.path(content_hash)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def delete(self, content_hash: str) -> None:
+        try:
+            os.remove(self.path(content_hash))
+        except FileNotFoundError:
+            pass
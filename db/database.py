@@ -1,30 +1,147 @@
 # db/database.py
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker, undefer
 from contextlib import contextmanager
-from typing import Optional
+from typing import Dict, Optional
+import base64
 import logging
-from .models import Base
+import time
+from .blob_store import BlobStore
+from .migrations import run_migrations
+from .models import Base, Image
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    def __init__(self, db_url: str):
-        self.engine = create_engine(db_url)
+    def __init__(
+        self,
+        db_url: str,
+        blob_store: Optional[BlobStore] = None,
+        profile: Optional[Dict] = None,
+        pool_options: Optional[Dict] = None
+    ):
+        profile = profile or {}
+        self.engine = create_engine(db_url, **(pool_options or {}))
+        if self.engine.dialect.name == 'sqlite':
+            self._configure_sqlite(
+                profile.get('sqlite_pragmas', {}),
+                profile.get('sqlite_begin_immediate', False)
+            )
+
         self.SessionLocal = sessionmaker(bind=self.engine)
+        # Same pool; the execution option marks connections of write sessions
+        self.WriteSessionLocal = sessionmaker(bind=self.engine.execution_options(write_session=True))
+        self.blob_store = blob_store
+
+    def _configure_sqlite(self, pragmas: Dict, begin_immediate: bool):
+        """Apply per-connection PRAGMAs and optionally BEGIN IMMEDIATE for write sessions"""
+        @event.listens_for(self.engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            if begin_immediate:
+                # Stop pysqlite from emitting its own deferred BEGIN
+                dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+        if begin_immediate:
+            @event.listens_for(self.engine, "begin")
+            def begin_transaction(conn):
+                # Reads keep a deferred BEGIN so they never wait on the writer lock
+                if conn.get_execution_options().get('write_session'):
+                    conn.exec_driver_sql("BEGIN IMMEDIATE")
+                else:
+                    conn.exec_driver_sql("BEGIN")
 
     @contextmanager
-    def get_db_session(self):
-        session = self.SessionLocal()
+    def get_db_session(self, write: bool = False):
+        """Transactional session; pass write=True for sessions that modify data"""
+        session = (self.WriteSessionLocal if write else self.SessionLocal)()
         try:
             yield session
             session.commit()
         except Exception as e:
             session.rollback()
-            logger.error(f"Database error: {str(e)}")
+            logger.error("Database error: %s", e)
             raise
         finally:
             session.close()
 
+    def ping(self) -> bool:
+        """Check that a pooled connection can run a trivial query"""
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+
+    def pool_stats(self) -> Dict:
+        """Connection pool usage, for health checks and sizing"""
+        pool = self.engine.pool
+        stats = {"backend": self.engine.dialect.name, "pool": type(pool).__name__}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
+
     def init_db(self):
-        Base.metadata.create_all(self.engine)
\ No newline at end of file
+        Base.metadata.create_all(self.engine)
+        run_migrations(self.engine)
+        if self.blob_store is not None:
+            self.migrate_image_blobs()
+
+    def sweep_blobs(self, grace_seconds: float, batch_size: int = 500) -> int:
+        """Delete blobs no image references, returning the count.
+
+        Blobs put within grace_seconds are kept: their image row may not be
+        committed yet. Runs apart from deletes so those never race a new upload.
+        """
+        cutoff = time.time() - grace_seconds
+        candidates = [
+            content_hash for content_hash, mtime in self.blob_store.iter_blobs()
+            if mtime < cutoff
+        ]
+        swept = 0
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            with self.get_db_session() as session:
+                referenced = {
+                    content_hash for (content_hash,) in session.query(Image.content_hash).filter(
+                        Image.content_hash.in_(batch)
+                    )
+                }
+            for content_hash in batch:
+                if content_hash in referenced:
+                    continue
+                # Re-check: an upload may have put it again since it was listed
+                mtime = self.blob_store.mtime(content_hash)
+                if mtime is not None and mtime < cutoff:
+                    self.blob_store.delete(content_hash)
+                    swept += 1
+
+        if swept:
+            logger.info("Swept %d unreferenced blobs", swept)
+        return swept
+
+    def migrate_image_blobs(self, batch_size: int = 100) -> int:
+        """Move legacy inline base64 images into the blob store, returning the count"""
+        migrated = 0
+        while True:
+            with self.get_db_session(write=True) as session:
+                images = session.query(Image).options(undefer(Image.image_data)).filter(
+                    Image.image_data.isnot(None),
+                    Image.content_hash.is_(None)
+                ).limit(batch_size).all()
+                if not images:
+                    break
+
+                for image in images:
+                    image_bytes = base64.b64decode(image.image_data)
+                    image.content_hash = self.blob_store.put(image_bytes)
+                    image.size_bytes = len(image_bytes)
+                    image.mime_type = 'image/jpeg'
+                    image.image_data = None
+                migrated += len(images)
+
+        if migrated:
+            logger.info("Migrated %d inline images to the blob store", migrated)
+        return migrated
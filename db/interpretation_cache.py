@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from datetime import datetime, UTC
+from sqlalchemy import func
+from typing import Dict, Optional
+import threading
+import logging
+from .models import ImageInterpretation
+
+logger = logging.getLogger(__name__)
+
+class InterpretationCache:
+    """Two-tier cache of image interpretations keyed by content hash.
+
+    An in-memory LRU, bounded by total interpretation size, sits in front of
+    the persistent image_interpretations table, which is pruned by last use
+    once it grows past max_entries.
+    """
+
+    def __init__(self, db_manager, memory_max_bytes: int, max_entries: int):
+        self.db_manager = db_manager
+        self.memory_max_bytes = memory_max_bytes
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # cache_key -> interpretation
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.persistent_evictions = 0
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """Return a cached interpretation, checking memory before the database"""
+        with self._lock:
+            interpretation = self._memory.get(cache_key)
+            if interpretation is not None:
+                self._memory.move_to_end(cache_key)
+                self.memory_hits += 1
+                return interpretation
+
+        with self.db_manager.get_db_session() as session:
+            interpretation = session.query(ImageInterpretation.interpretation).filter_by(
+                cache_key=cache_key
+            ).scalar()
+        if interpretation is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Only a hit takes the write lock; it is promoted to memory afterwards
+        with self.db_manager.get_db_session(write=True) as session:
+            session.query(ImageInterpretation).filter_by(cache_key=cache_key).update({
+                "hit_count": func.coalesce(ImageInterpretation.hit_count, 0) + 1,
+                "last_used_at": datetime.now(UTC)
+            })
+
+        with self._lock:
+            self.persistent_hits += 1
+            self._remember(cache_key, interpretation)
+        return interpretation
+
+    def put(self, cache_key: str, model: str, prompt_version: str, interpretation: str) -> None:
+        """Store an interpretation in both tiers"""
+        with self.db_manager.get_db_session(write=True) as session:
+            session.merge(ImageInterpretation(
+                cache_key=cache_key,
+                model=model,
+                prompt_version=prompt_version,
+                interpretation=interpretation,
+                size_bytes=len(interpretation.encode('utf-8')),
+                hit_count=0,
+                last_used_at=datetime.now(UTC)
+            ))
+            session.flush()
+            self._prune_persistent(session)
+
+        with self._lock:
+            self._remember(cache_key, interpretation)
+
+    def stats(self) -> Dict:
+        """Hit-rate and size metrics for both cache tiers"""
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.memory_max_bytes,
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "memory_evictions": self.memory_evictions,
+                "persistent_evictions": self.persistent_evictions,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+    def _remember(self, cache_key: str, interpretation: str) -> None:
+        # Must be called with self._lock held
+        previous = self._memory.pop(cache_key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous.encode('utf-8'))
+
+        size = len(interpretation.encode('utf-8'))
+        if size > self.memory_max_bytes:
+            return
+
+        self._memory[cache_key] = interpretation
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.encode('utf-8'))
+            self.memory_evictions += 1
+
+    def _prune_persistent(self, session) -> None:
+        excess = session.query(ImageInterpretation).count() - self.max_entries
+        if excess <= 0:
+            return
+
+        stale_keys = session.query(ImageInterpretation.cache_key).order_by(
+            ImageInterpretation.last_used_at.asc()
+        ).limit(excess)
+        deleted = session.query(ImageInterpretation).filter(
+            ImageInterpretation.cache_key.in_(stale_keys.scalar_subquery())
+        ).delete(synchronize_session=False)
+        with self._lock:
+            self.persistent_evictions += deleted
+        logger.info("Pruned %d image interpretation cache entries", deleted)
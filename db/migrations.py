@@ -0,0 +1,71 @@
+# db/migrations.py
+"""Versioned schema migrations for databases created by older releases.
+
+Base.metadata.create_all only creates missing tables, so changes to
+existing tables (new columns, new indexes) are applied here. The applied
+version is kept in the single-row schema_version table. Every migration
+must be idempotent because fresh databases already get the full schema
+from create_all before the migrations run.
+"""
+from sqlalchemy import inspect, text
+import logging
+from .models import Base, Image, Session
+
+logger = logging.getLogger(__name__)
+
+def _add_columns(conn, table, columns):
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    for column in columns:
+        if column.name not in existing:
+            logger.info("Adding %s.%s column", table.name, column.name)
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def _create_indexes(conn, tables):
+    for table in tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+def add_image_blob_columns(conn):
+    """Blob-store columns on images (content_hash, size_bytes, mime_type)"""
+    columns = Image.__table__.c
+    _add_columns(conn, Image.__table__, [columns.content_hash, columns.size_bytes, columns.mime_type])
+    _create_indexes(conn, [Image.__table__])
+
+def add_hot_path_indexes(conn):
+    """Composite indexes for history, medical record, session and image lookups"""
+    _create_indexes(conn, Base.metadata.sorted_tables)
+
+def add_session_summary_columns(conn):
+    """Conversation summary columns on sessions (summary, summary_message_id)"""
+    columns = Session.__table__.c
+    _add_columns(conn, Session.__table__, [columns.summary, columns.summary_message_id])
+
+# (version, migration) in the order they must be applied
+MIGRATIONS = [
+    (1, add_image_blob_columns),
+    (2, add_hot_path_indexes),
+    (3, add_session_summary_columns),
+]
+
+def get_schema_version(conn) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+def run_migrations(engine) -> int:
+    """Apply pending migrations, each in its own transaction, and return the schema version"""
+    with engine.begin() as conn:
+        version = get_schema_version(conn)
+
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        logger.info("Applying schema migration %d: %s", target, migration.__doc__)
+        with engine.begin() as conn:
+            migration(conn)
+            conn.execute(text("DELETE FROM schema_version"))
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": target})
+        version = target
+
+    return version
@@ -1,56 +1,95 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, JSON
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Index, Text, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 import datetime
 
 Base = declarative_base()
 
+# Portable column types: timezone-aware timestamps and JSONB on PostgreSQL
+Timestamp = DateTime(timezone=True)
+JSONType = JSON().with_variant(JSONB(), 'postgresql')
+
+def utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
     external_id = Column(String(50), unique=True)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(Timestamp, default=utcnow)
     sessions = relationship("Session", back_populates="user")
     medical_records = relationship("MedicalRecord", back_populates="user")
 
 class Session(Base):
     __tablename__ = 'sessions'
+    __table_args__ = (
+        Index('ix_sessions_user_active', 'user_id', 'is_active'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     is_active = Column(Boolean, default=True)
     current_agent = Column(String(50))
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    last_interaction = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(Timestamp, default=utcnow)
+    last_interaction = Column(Timestamp, default=utcnow)
+    # Rolling summary of the conversation up to and including summary_message_id
+    summary = Column(Text)
+    summary_message_id = Column(Integer)
     user = relationship("User", back_populates="sessions")
     messages = relationship("Message", back_populates="session")
     images = relationship("Image", back_populates="session")
 
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Serves the per-turn history query (session_id = ? ORDER BY created_at DESC)
+        Index('ix_messages_session_created', 'session_id', 'created_at'),
+    )
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('sessions.id'))
     role = Column(String(20))  # user, assistant, system, tool
     content = Column(Text)
     visible_to_user = Column(Boolean, default=True)
-    message_metadata = Column(JSON)  # Renamed from metadata to message_metadata
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    message_metadata = Column(JSONType)  # Renamed from metadata to message_metadata
+    created_at = Column(Timestamp, default=utcnow)
     session = relationship("Session", back_populates="messages")
 
 class Image(Base):
     __tablename__ = 'images'
+    __table_args__ = (
+        Index('ix_images_session_processed', 'session_id', 'processed'),
+    )
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('sessions.id'))
-    image_data = Column(Text)  # Base64 encoded image
+    image_data = deferred(Column(Text))  # Legacy inline base64 image, migrated to the blob store
+    content_hash = Column(String(64), index=True)  # sha256 of the bytes in the blob store
+    size_bytes = Column(Integer)
+    mime_type = Column(String(50))
     interpretation = Column(Text)
     processed = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(Timestamp, default=utcnow)
     session = relationship("Session", back_populates="images")
 
 class MedicalRecord(Base):
     __tablename__ = 'medical_records'
+    __table_args__ = (
+        Index('ix_medical_records_user_type', 'user_id', 'data_type'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     data_type = Column(String(50))  # symptoms, diagnosis, etc.
-    data = Column(JSON)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    user = relationship("User", back_populates="medical_records")
\ No newline at end of file
+    data = Column(JSONType)
+    created_at = Column(Timestamp, default=utcnow)
+    user = relationship("User", back_populates="medical_records")
+
+class ImageInterpretation(Base):
+    """Content-addressed cache of vision-model interpretations"""
+    __tablename__ = 'image_interpretations'
+    cache_key = Column(String(64), primary_key=True)  # sha256 of image bytes + model + prompt version
+    model = Column(String(100))
+    prompt_version = Column(String(16))
+    interpretation = Column(Text)
+    size_bytes = Column(Integer)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(Timestamp, default=utcnow)
+    last_used_at = Column(Timestamp, default=utcnow, index=True)
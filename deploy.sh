@@ -11,7 +11,7 @@ source venv/bin/activate
 
 # Install requirements
 echo "Installing main requirements..."
-pip install Flask gunicorn openai dataclasses python-telegram-bot requests sqlalchemy pillow "httpx[socks]"
+pip install -r requirements.txt
 
 # Run the telegram bot normally in the background
 echo "Starting Telegram bot..."
@@ -20,9 +20,9 @@ TG_BOT_PID=$!
 
 sleep 3
 
-# Run Flask app normally
+# Serve the Quart app with hypercorn
 echo "Starting main application..."
-nohup python app.py > app.log 2>&1 &
+nohup hypercorn --bind 0.0.0.0:5000 app:app > app.log 2>&1 &
 APP_PID=$!
 
 echo "Services started:"
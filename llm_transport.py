@@ -0,0 +1,226 @@
+from config import (
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_RESET_TIMEOUT,
+    LLM_CONNECT_TIMEOUT,
+    LLM_HTTP2,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_MAX_RETRIES,
+    LLM_POOL_TIMEOUT,
+    LLM_PROXY_URL,
+    LLM_READ_TIMEOUT,
+    LLM_RETRY_BACKOFF_BASE,
+    LLM_RETRY_BACKOFF_MAX
+)
+from email.utils import parsedate_to_datetime
+from datetime import datetime, UTC
+from typing import Dict, Optional
+import asyncio
+import importlib.util
+import logging
+import random
+import threading
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadTimeout,
+    httpx.RemoteProtocolError,
+)
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised without contacting upstream while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Opens after failure_threshold consecutive upstream failures, rejects calls
+    for reset_timeout seconds, then lets a single probe through (half-open);
+    the probe's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            was_probe = self._probe_in_flight
+            self._probe_in_flight = False
+            if was_probe or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+                logger.warning("LLM circuit breaker opened after %d consecutive failures", self._failures)
+
+    def release_probe(self) -> None:
+        """Let another probe through after one ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _state(self, now: float) -> str:
+        # Must be called with self._lock held
+        if self._opened_at is None:
+            return 'closed'
+        if now - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport with jittered exponential retries and a circuit breaker.
+
+    Retries connection errors, read timeouts and 429/5xx responses, honouring
+    Retry-After when upstream sends it.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        breaker: CircuitBreaker,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float
+    ):
+        self._transport = transport
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError("LLM upstream circuit is open", request=request)
+
+            try:
+                response = await self._transport.handle_async_request(request)
+            except RETRYABLE_EXCEPTIONS as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning("LLM request failed (%s), retrying in %.2fs", type(e).__name__, delay)
+            except httpx.PoolTimeout:
+                # Our own connection pool is saturated: no verdict on upstream
+                self.breaker.release_probe()
+                raise
+            except Exception:
+                # Non-retryable errors (read/write errors) still count,
+                # otherwise a failed half-open probe would block the circuit for good
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Cancelled: no verdict on upstream, but the probe slot must be freed
+                self.breaker.release_probe()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.breaker.record_success()
+                    return response
+
+                # 429 means we are throttled, not that upstream is unhealthy
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if attempt >= self.max_retries:
+                    return response
+
+                delay = max(self._backoff(attempt), self._retry_after(response) or 0)
+                await response.aclose()
+                logger.warning("LLM request returned %d, retrying in %.2fs", response.status_code, delay)
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def stats(self) -> Dict:
+        return {
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+            "retries": self.retries
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform over [0, capped exponential]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(value) - datetime.now(UTC)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0.0), self.backoff_max)
+
+def llm_timeout() -> httpx.Timeout:
+    """Per-request timeouts for LLM calls; read covers the gap between streamed chunks"""
+    return httpx.Timeout(
+        connect=LLM_CONNECT_TIMEOUT,
+        read=LLM_READ_TIMEOUT,
+        write=LLM_CONNECT_TIMEOUT,
+        pool=LLM_POOL_TIMEOUT
+    )
+
+def build_llm_transport() -> RetryTransport:
+    """Pooled transport with retries and a circuit breaker, shared by all LLM calls"""
+    # HTTP/2 needs the optional h2 package
+    http2 = LLM_HTTP2 and importlib.util.find_spec('h2') is not None
+    transport = httpx.AsyncHTTPTransport(
+        proxy=LLM_PROXY_URL or None,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        )
+    )
+    return RetryTransport(
+        transport,
+        CircuitBreaker(LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_TIMEOUT),
+        max_retries=LLM_MAX_RETRIES,
+        backoff_base=LLM_RETRY_BACKOFF_BASE,
+        backoff_max=LLM_RETRY_BACKOFF_MAX
+    )
@@ -0,0 +1,76 @@
+from config import (
+    LOG_BACKUP_COUNT,
+    LOG_FILE,
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+    LOG_MODULE_LEVELS,
+    LOG_PAYLOAD_MAX_CHARS,
+    LOG_PAYLOADS
+)
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from metrics import RequestIdFilter
+import atexit
+import logging
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+def configure_logging() -> QueueListener:
+    """Send all log records through a queue to a background writer thread.
+
+    Request handlers only enqueue records; a QueueListener thread formats
+    them and writes the rotating log file and stderr. The request ID is
+    attached before enqueueing, while the request's context is current.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    # No formatter here: the queue handler only merges msg % args, the listener formats the line
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    for name, level in LOG_MODULE_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Flush what is still queued on shutdown
+    atexit.register(listener.stop)
+    return listener
+
+class LogPayload:
+    """Log argument that renders a prompt or LLM response only if the record is emitted.
+
+    With LOG_PAYLOADS off only the payload's size is logged, keeping patient
+    data out of the logs; otherwise it is capped at LOG_PAYLOAD_MAX_CHARS.
+    """
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        if not LOG_PAYLOADS:
+            if isinstance(self.payload, (list, tuple)):
+                return f"<{len(self.payload)} items, redacted>"
+            return f"<{type(self.payload).__name__}, redacted>"
+
+        text = str(self.payload)
+        if len(text) > LOG_PAYLOAD_MAX_CHARS:
+            return f"{text[:LOG_PAYLOAD_MAX_CHARS]}... [{len(text)} chars]"
+        return text
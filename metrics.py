@@ -0,0 +1,75 @@
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram
+import logging
+import uuid
+
+# Request ID of the request being handled, propagated into worker threads and tasks
+request_id_var = ContextVar('request_id', default='-')
+
+# Stages of a request are sub-second; LLM calls take seconds to minutes
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    'medical_app_request_seconds',
+    'Time until the response headers are sent, by endpoint and status',
+    ['endpoint', 'status'],
+    buckets=LLM_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'medical_app_stage_seconds',
+    'Latency of request stages (container lookup, history query, patient context, commits)',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+LLM_CALL_SECONDS = Histogram(
+    'medical_app_llm_call_seconds',
+    'Duration of LLM completions',
+    ['model', 'stream'],
+    buckets=LLM_BUCKETS
+)
+LLM_TTFT_SECONDS = Histogram(
+    'medical_app_llm_time_to_first_token_seconds',
+    'Time until the first streamed token of an LLM completion',
+    ['model'],
+    buckets=LLM_BUCKETS
+)
+LLM_TOKENS = Counter(
+    'medical_app_llm_tokens',
+    'LLM tokens by kind (prompt, cached, completion)',
+    ['model', 'kind']
+)
+TOOL_CALL_SECONDS = Histogram(
+    'medical_app_tool_call_seconds',
+    'Duration of agent tool calls',
+    ['tool'],
+    buckets=STAGE_BUCKETS
+)
+HANDOFFS = Counter(
+    'medical_app_handoffs',
+    'Agent handoffs',
+    ['from_agent', 'to_agent']
+)
+
+def stage_timer(stage: str):
+    """Context manager (or decorator) observing a stage's duration"""
+    return STAGE_SECONDS.labels(stage).time()
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+def record_llm_usage(model: str, usage) -> None:
+    """Count prompt, cached and completion tokens of an LLM response's usage"""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    LLM_TOKENS.labels(model, 'prompt').inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels(model, 'cached').inc(getattr(details, "cached_tokens", None) or 0)
+    LLM_TOKENS.labels(model, 'completion').inc(usage.completion_tokens or 0)
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request ID to log records as %(request_id)s"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
@@ -0,0 +1,31 @@
+import importlib.util
+import pathlib
+import sys
+import types
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# agents/__init__.py pulls in swarm for the agent classes; the storage and queue
+# modules under test do not need it, so register the package without running it
+if 'agents' not in sys.modules and importlib.util.find_spec('swarm') is None:
+    agents_package = types.ModuleType('agents')
+    agents_package.__path__ = [str(ROOT / 'agents')]
+    sys.modules['agents'] = agents_package
+
+@pytest.fixture
+def db_accessor_agent(db_manager):
+    """DBAccessorAgent of a new user with an active session, on the module's db_manager"""
+    from agents.db_agent import DBAccessorAgent
+    from db.models import Session, User
+
+    with db_manager.get_db_session(write=True) as session:
+        user = User(external_id='patient')
+        session.add(user)
+        session.flush()
+        active_session = Session(user_id=user.id, is_active=True)
+        session.add(active_session)
+        session.flush()
+        user_context = {"user_id": user.id, "session_id": active_session.id}
+    return DBAccessorAgent(db_manager, user_context)
@@ -0,0 +1,126 @@
+"""Storage behaviour on both supported backends.
+
+The PostgreSQL cases run against a throwaway server spawned with the
+pgserver package (pip install pgserver "psycopg[binary]") and are skipped
+when it is not installed.
+"""
+from db.database import DatabaseManager
+from db.interpretation_cache import InterpretationCache
+from db.migrations import MIGRATIONS, run_migrations
+from db.models import Base, Message
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect, text
+import itertools
+import pytest
+
+# Columns and indexes added to existing tables by MIGRATIONS
+MIGRATED_COLUMNS = {
+    ('images', 'content_hash'),
+    ('images', 'size_bytes'),
+    ('images', 'mime_type'),
+    ('sessions', 'summary'),
+    ('sessions', 'summary_message_id'),
+}
+database_names = itertools.count()
+
+
+@pytest.fixture(scope='session')
+def postgres_server(tmp_path_factory):
+    pgserver = pytest.importorskip('pgserver')
+    pytest.importorskip('psycopg')
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('postgres')), cleanup_mode='stop')
+    yield server.get_uri().replace('postgresql://', 'postgresql+psycopg://', 1)
+    server.cleanup()
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database_url(request, tmp_path):
+    """URL of an empty database on each backend"""
+    if request.param == 'sqlite':
+        yield f"sqlite:///{tmp_path / 'medical_app.db'}"
+        return
+
+    server_url = request.getfixturevalue('postgres_server')
+    name = f"test_{next(database_names)}"
+    admin = create_engine(server_url, isolation_level='AUTOCOMMIT')
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    database_url = server_url.replace('/postgres?', f'/{name}?', 1)
+    yield database_url
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE {name} WITH (FORCE)"))
+    admin.dispose()
+
+@pytest.fixture
+def db_manager(database_url):
+    manager = DatabaseManager(database_url)
+    manager.init_db()
+    yield manager
+    manager.engine.dispose()
+
+def create_legacy_schema(engine) -> None:
+    """Tables as created by releases before the versioned migrations"""
+    legacy = MetaData()
+    for table in Base.metadata.sorted_tables:
+        columns = [
+            Column(column.name, column.type, primary_key=column.primary_key)
+            for column in table.columns
+            if (table.name, column.name) not in MIGRATED_COLUMNS
+        ]
+        Table(table.name, legacy, *columns)
+    legacy.create_all(engine)
+
+def test_save_turn_returns_ids_in_message_order(db_accessor_agent):
+    session_id = db_accessor_agent.user_context['session_id']
+    object.__setattr__(db_accessor_agent, 'message_history', [])
+    user_messages = [{"role": "user", "content": f"message {n}"} for n in range(20)]
+    response_messages = [{"role": "assistant", "content": "reply"}]
+
+    db_accessor_agent.save_turn(session_id, user_messages, response_messages, agent_name="Doctor")
+
+    buffered = db_accessor_agent.message_history
+    assert [message["content"] for message in buffered] == [f"message {n}" for n in range(20)] + ["reply"]
+    # Each id returned by INSERT ... RETURNING belongs to the message it was paired with
+    assert db_accessor_agent.get_recent_messages(session_id, 100) == buffered
+
+def test_migrations_upgrade_a_legacy_schema(database_url):
+    engine = create_engine(database_url)
+    create_legacy_schema(engine)
+
+    DatabaseManager(database_url).init_db()
+
+    inspector = inspect(engine)
+    for table, column in MIGRATED_COLUMNS:
+        assert column in {c['name'] for c in inspector.get_columns(table)}
+    assert 'ix_messages_session_created' in {index['name'] for index in inspector.get_indexes('messages')}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT version FROM schema_version")).scalars().all() == [MIGRATIONS[-1][0]]
+    # Re-running is a no-op
+    assert run_migrations(engine) == MIGRATIONS[-1][0]
+    engine.dispose()
+
+def test_interpretation_cache_prunes_least_recently_used(db_manager):
+    # No memory tier, so every get goes to the table and bumps last_used_at
+    cache = InterpretationCache(db_manager, memory_max_bytes=0, max_entries=2)
+    cache.put('a', 'model', 'v1', 'first')
+    cache.put('b', 'model', 'v1', 'second')
+    assert cache.get('a') == 'first'
+
+    cache.put('c', 'model', 'v1', 'third')
+
+    assert [cache.get(key) for key in ('a', 'b', 'c')] == ['first', None, 'third']
+    assert cache.stats()['persistent_evictions'] == 1
+
+def test_message_metadata_is_queryable_json(db_manager, db_accessor_agent):
+    session_id = db_accessor_agent.user_context['session_id']
+    db_accessor_agent.save_message(session_id, 'tool', 'done', message_metadata={"tool": "update_medical_record"})
+    db_accessor_agent.save_message(session_id, 'assistant', 'hello')
+
+    column_type = inspect(db_manager.engine).get_columns('messages')
+    column_type = next(column['type'] for column in column_type if column['name'] == 'message_metadata')
+    expected = 'JSONB' if db_manager.engine.dialect.name == 'postgresql' else 'JSON'
+    assert type(column_type).__name__ == expected
+
+    with db_manager.get_db_session() as session:
+        contents = session.query(Message.content).filter(
+            Message.message_metadata['tool'].as_string() == 'update_medical_record'
+        ).all()
+    assert contents == [('done',)]
@@ -0,0 +1,46 @@
+from db.blob_store import BlobStore
+from db.database import DatabaseManager
+from db.models import Image
+import os
+import time
+import pytest
+
+GRACE_SECONDS = 60
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = DatabaseManager(
+        f"sqlite:///{tmp_path / 'medical_app.db'}",
+        blob_store=BlobStore(str(tmp_path / 'blobs'))
+    )
+    manager.init_db()
+    return manager
+
+def age(blob_store: BlobStore, content_hash: str, seconds: float) -> None:
+    past = time.time() - seconds
+    os.utime(blob_store.path(content_hash), (past, past))
+
+def test_sweep_deletes_only_old_unreferenced_blobs(db_manager):
+    blob_store = db_manager.blob_store
+    referenced = blob_store.put(b"referenced")
+    orphaned = blob_store.put(b"orphaned")
+    fresh = blob_store.put(b"fresh")
+    with db_manager.get_db_session(write=True) as session:
+        session.add(Image(content_hash=referenced, size_bytes=10))
+    for content_hash in (referenced, orphaned):
+        age(blob_store, content_hash, 2 * GRACE_SECONDS)
+
+    assert db_manager.sweep_blobs(GRACE_SECONDS) == 1
+    assert not blob_store.exists(orphaned)
+    assert blob_store.exists(referenced) and blob_store.exists(fresh)
+
+def test_put_of_existing_blob_protects_it_from_the_sweep(db_manager):
+    blob_store = db_manager.blob_store
+    content_hash = blob_store.put(b"photo")
+    age(blob_store, content_hash, 2 * GRACE_SECONDS)
+
+    # A second upload of the same bytes, whose image row is not committed yet
+    assert blob_store.put(b"photo") == content_hash
+    assert db_manager.sweep_blobs(GRACE_SECONDS) == 0
+    assert blob_store.read(content_hash) == b"photo"
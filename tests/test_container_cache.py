@@ -0,0 +1,75 @@
+from agents.container_cache import AgentContainerCache
+import threading
+import time
+
+
+def test_pinned_entry_survives_lru_eviction():
+    cache = AgentContainerCache(max_size=2, ttl_seconds=60)
+    in_flight = cache.get_or_create('a', object, pin=True)
+    cache.get_or_create('b', object)
+    cache.get_or_create('c', object)
+
+    # 'a' is least recently used, but its turn still runs on it
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get_or_create('a', object) is in_flight
+
+    cache.unpin('a')
+    cache.get_or_create('d', object)
+    cache.get_or_create('e', object)
+    assert 'a' not in cache
+    assert cache.stats()['pinned'] == 0
+
+def test_pinned_entry_survives_idle_ttl():
+    cache = AgentContainerCache(max_size=10, ttl_seconds=0.05)
+    in_flight = cache.get_or_create('a', object, pin=True)
+    cache.get_or_create('b', object)
+    time.sleep(0.1)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is in_flight
+
+    # Unpinning counts as a use, so the entry gets a full TTL from the end of the turn
+    cache.unpin('a')
+    assert cache.get('a') is in_flight
+    time.sleep(0.1)
+    assert cache.get('a') is None
+
+def test_pins_are_counted_per_holder():
+    cache = AgentContainerCache(max_size=1, ttl_seconds=60)
+    cache.get_or_create('a', object, pin=True)
+    cache.get_or_create('a', object, pin=True)
+
+    cache.unpin('a')
+    cache.get_or_create('b', object)
+    assert 'a' in cache
+
+    cache.unpin('a')
+    cache.get_or_create('c', object)
+    assert 'a' not in cache
+
+def test_waiter_on_a_pending_build_is_pinned_too():
+    cache = AgentContainerCache(max_size=1, ttl_seconds=60)
+    release = threading.Event()
+    container = object()
+
+    def slow_factory():
+        release.wait()
+        return container
+
+    owner = threading.Thread(target=cache.get_or_create, args=('a', slow_factory))
+    owner.start()
+    while not cache.stats()['pending']:
+        time.sleep(0.01)
+
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(cache.get_or_create('a', object, pin=True)))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    owner.join()
+    waiter.join()
+
+    assert waited == [container]
+    cache.get_or_create('b', object)
+    assert cache.get('a') is container
@@ -0,0 +1,120 @@
+from config import DB_ENGINE_PROFILES
+from db.database import DatabaseManager
+from db.interpretation_cache import InterpretationCache
+from db.models import Session
+from contextlib import contextmanager
+import threading
+import time
+import pytest
+
+WRITER_HOLD_SECONDS = 1.0
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = DatabaseManager(
+        f"sqlite:///{tmp_path / 'medical_app.db'}",
+        profile=DB_ENGINE_PROFILES['production']
+    )
+    manager.init_db()
+    return manager
+
+def hold_write_lock(db_manager, locked: threading.Event) -> threading.Thread:
+    """Start a write session that keeps the writer lock for WRITER_HOLD_SECONDS"""
+    def writer():
+        with db_manager.get_db_session(write=True) as session:
+            session.query(Session).update({"current_agent": "Doctor"})
+            locked.set()
+            time.sleep(WRITER_HOLD_SECONDS)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert locked.wait(5)
+    return thread
+
+def test_reads_do_not_wait_on_the_writer_lock(db_manager, db_accessor_agent):
+    session_id = db_accessor_agent.user_context['session_id']
+    db_accessor_agent.save_turn(session_id, [{"role": "user", "content": "hello"}], [])
+    cache = InterpretationCache(db_manager, memory_max_bytes=1024, max_entries=10)
+
+    writer = hold_write_lock(db_manager, threading.Event())
+    started = time.perf_counter()
+    messages = db_accessor_agent.get_recent_messages(session_id, 10)
+    records = db_accessor_agent.get_medical_records()
+    summary = db_accessor_agent.get_summary(session_id)
+    cached = cache.get('missing')
+    db_manager.ping()
+    elapsed = time.perf_counter() - started
+    writer.join()
+
+    assert [message["content"] for message in messages] == ["hello"]
+    assert records == {} and summary == (None, 0) and cached is None
+    assert elapsed < WRITER_HOLD_SECONDS / 2
+
+def test_write_sessions_wait_for_the_writer_lock(db_manager, db_accessor_agent):
+    session_id = db_accessor_agent.user_context['session_id']
+    writer = hold_write_lock(db_manager, threading.Event())
+    started = time.perf_counter()
+    db_accessor_agent.save_summary(session_id, "summary", 1)
+    elapsed = time.perf_counter() - started
+    writer.join()
+
+    # BEGIN IMMEDIATE queued on busy_timeout instead of failing with "database is locked"
+    assert elapsed >= WRITER_HOLD_SECONDS / 2
+    assert db_accessor_agent.get_summary(session_id) == ("summary", 1)
+
+def test_concurrent_read_then_write_sessions_do_not_fail(db_manager, db_accessor_agent):
+    errors = []
+
+    def update_record(index):
+        try:
+            for round_ in range(10):
+                db_accessor_agent.update_medical_record(f"field_{index}", str(round_))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=update_record, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db_accessor_agent.invalidate_medical_history()
+    assert db_accessor_agent.get_medical_records() == {f"field_{index}": "9" for index in range(8)}
+
+def test_patient_data_is_prepared_once_per_records_version(db_accessor_agent):
+    prepared = []
+
+    def prepare(records):
+        prepared.append(dict(records))
+        return len(prepared)
+
+    db_accessor_agent.update_medical_record("allergies", "none")
+    assert db_accessor_agent.get_patient_data(prepare) == 1
+    assert db_accessor_agent.get_patient_data(prepare) == 1
+
+    db_accessor_agent.update_medical_record("allergies", "penicillin")
+    assert db_accessor_agent.get_patient_data(prepare) == 2
+    db_accessor_agent.invalidate_medical_history()
+    assert db_accessor_agent.get_patient_data(prepare) == 3
+    assert prepared == [{"allergies": "none"}] + [{"allergies": "penicillin"}] * 2
+
+def test_records_load_racing_a_write_is_not_cached(db_manager, db_accessor_agent, monkeypatch):
+    db_accessor_agent.update_medical_record("allergies", "none")
+    get_db_session = db_manager.get_db_session
+    raced = []
+
+    @contextmanager
+    def read_then_race_a_write(write=False):
+        with get_db_session(write) as session:
+            yield session
+        # The load has read its rows; a write commits before it caches them
+        if not write and not raced:
+            raced.append(True)
+            db_accessor_agent.update_medical_record("allergies", "penicillin")
+
+    monkeypatch.setattr(db_manager, 'get_db_session', read_then_race_a_write)
+    assert db_accessor_agent.get_medical_records() == {"allergies": "penicillin"}
+    monkeypatch.undo()
+    assert db_accessor_agent.get_medical_records() == {"allergies": "penicillin"}
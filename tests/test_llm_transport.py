@@ -0,0 +1,122 @@
+from llm_transport import CircuitBreaker, RetryTransport
+import asyncio
+import socket
+import struct
+import httpx
+import pytest
+
+
+async def start_server(handle):
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+
+async def reset_connection(reader, writer):
+    """Read the request, then reset the connection: the client sees httpx.ReadError"""
+    await reader.readuntil(b"\r\n\r\n")
+    sock = writer.get_extra_info('socket')
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+    writer.close()
+
+async def hang(reader, writer):
+    await reader.readuntil(b"\r\n\r\n")
+    await asyncio.sleep(60)
+
+async def respond_ok(reader, writer):
+    await reader.readuntil(b"\r\n\r\n")
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+    await writer.drain()
+    writer.close()
+
+async def respond_ok_slowly(reader, writer):
+    await asyncio.sleep(0.3)
+    await respond_ok(reader, writer)
+
+def half_open_breaker() -> CircuitBreaker:
+    # reset_timeout=0: the circuit is half-open as soon as it opens
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == 'half_open'
+    return breaker
+
+def client_for(breaker: CircuitBreaker, max_connections=None) -> httpx.AsyncClient:
+    transport = RetryTransport(
+        httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=max_connections)),
+        breaker,
+        max_retries=0,
+        backoff_base=0,
+        backoff_max=0
+    )
+    return httpx.AsyncClient(transport=transport)
+
+def test_failed_probe_with_non_retryable_error_frees_the_probe():
+    async def scenario():
+        breaker = half_open_breaker()
+        server, url = await start_server(reset_connection)
+        async with server, client_for(breaker) as client:
+            with pytest.raises(httpx.ReadError):
+                await client.get(url)
+        # The probe failed, so the circuit re-opened and a new probe is allowed
+        assert breaker.times_opened == 2
+        assert breaker.allow_request()
+
+    asyncio.run(scenario())
+
+def test_cancelled_probe_frees_the_probe():
+    async def scenario():
+        breaker = half_open_breaker()
+        server, url = await start_server(hang)
+        async with server, client_for(breaker) as client:
+            request = asyncio.create_task(client.get(url))
+            await asyncio.sleep(0.1)
+            request.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await request
+        # Cancellation says nothing about upstream: no new failure, but the slot is free
+        assert breaker.times_opened == 1
+        assert breaker.allow_request()
+
+    asyncio.run(scenario())
+
+def test_successful_probe_closes_the_circuit():
+    async def scenario():
+        breaker = half_open_breaker()
+        server, url = await start_server(respond_ok)
+        async with server, client_for(breaker) as client:
+            response = await client.get(url)
+        assert response.text == 'ok'
+        assert breaker.state == 'closed'
+
+    asyncio.run(scenario())
+
+def test_pool_timeouts_do_not_open_the_circuit():
+    async def scenario():
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        server, url = await start_server(respond_ok_slowly)
+        async with server, client_for(breaker, max_connections=2) as client:
+            results = await asyncio.gather(
+                *(client.get(url, timeout=httpx.Timeout(5, pool=0.05)) for _ in range(10)),
+                return_exceptions=True
+            )
+        # A saturated local pool says nothing about upstream health
+        assert sum(isinstance(result, httpx.PoolTimeout) for result in results) == 8
+        assert breaker.times_opened == 0
+
+    asyncio.run(scenario())
+
+def test_probe_hitting_a_pool_timeout_frees_the_probe():
+    async def scenario():
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        server, url = await start_server(respond_ok_slowly)
+        async with server, client_for(breaker, max_connections=1) as client:
+            busy = asyncio.create_task(client.get(url))
+            await asyncio.sleep(0.05)
+            # Open the circuit and let the next request through as the half-open probe
+            breaker.record_failure()
+            breaker._opened_at -= breaker.reset_timeout
+            with pytest.raises(httpx.PoolTimeout):
+                await client.get(url, timeout=httpx.Timeout(5, pool=0.05))
+            assert breaker.times_opened == 1
+            assert breaker.allow_request()
+            await busy
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+from db.database import DatabaseManager
+from sqlalchemy import event
+import pytest
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'medical_app.db'}")
+    manager.init_db()
+    return manager
+
+def query_plan(db_manager, run_query) -> str:
+    """EXPLAIN QUERY PLAN of the single SELECT that run_query issues"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db_manager.engine, 'before_cursor_execute', capture)
+    try:
+        run_query()
+    finally:
+        event.remove(db_manager.engine, 'before_cursor_execute', capture)
+
+    assert len(statements) == 1
+    statement, parameters = statements[0]
+    with db_manager.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return "\n".join(row[-1] for row in rows)
+
+def test_recent_messages_query_uses_the_history_index(db_manager, db_accessor_agent):
+    session_id = db_accessor_agent.user_context['session_id']
+    plan = query_plan(db_manager, lambda: db_accessor_agent.get_recent_messages(session_id, 20))
+
+    assert 'USING INDEX ix_messages_session_created (session_id=?)' in plan
+    # The id tiebreak is the rowid, which SQLite appends to every index: no sort step
+    assert 'TEMP B-TREE' not in plan
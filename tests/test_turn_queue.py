@@ -0,0 +1,45 @@
+from agents.turn_queue import UserTurnQueue
+import asyncio
+import gc
+
+
+def test_drain_task_survives_garbage_collection():
+    async def scenario():
+        queue = UserTurnQueue()
+        release = asyncio.Event()
+
+        async def run_turn(messages):
+            await release.wait()
+            return messages
+
+        submitted = asyncio.ensure_future(queue.submit('user', 'hello', run_turn))
+        await asyncio.sleep(0)
+        gc.collect()
+        assert len(queue._tasks) == 1
+        release.set()
+        assert await submitted == (['hello'], True)
+        await asyncio.sleep(0)
+        assert not queue._tasks
+
+    asyncio.run(scenario())
+
+def test_messages_sent_mid_turn_are_coalesced():
+    async def scenario():
+        queue = UserTurnQueue()
+        release = asyncio.Event()
+
+        async def run_turn(messages):
+            await release.wait()
+            return list(messages)
+
+        first = asyncio.ensure_future(queue.submit('user', 1, run_turn))
+        await asyncio.sleep(0)
+        rest = [asyncio.ensure_future(queue.submit('user', n, run_turn)) for n in (2, 3)]
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await first == ([1], True)
+        assert await asyncio.gather(*rest) == [([2, 3], False), ([2, 3], True)]
+        assert queue.stats()["turns"] == 2 and queue.stats()["coalesced_messages"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import Optional
+import logging
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class ImageQueueFullError(Exception):
+    """Raised when too many photos are already waiting for preprocessing"""
+
+def preprocess_photo(
+    photo_bytes: bytes,
+    max_size: int = 1024,
+    quality: int = 85,
+    use_draft: bool = True,
+    reducing_gap: Optional[float] = None
+) -> bytes:
+    """Downscale a photo so its longest side is at most max_size and re-encode as JPEG.
+
+    Module-level so it can be pickled into a process pool. With use_draft,
+    libjpeg decodes JPEGs directly at 1/2, 1/4 or 1/8 scale, skipping most of
+    the full-resolution decode. reducing_gap enables Pillow's reduce-based
+    resampling: a cheap integer reduce first, then LANCZOS for the remainder.
+    """
+    img = Image.open(BytesIO(photo_bytes))
+    if use_draft and img.format == 'JPEG' and max(img.size) > max_size:
+        # Never decodes below the requested box, so quality is preserved. The box
+        # keeps the aspect ratio: a square one would rule out scaling whenever the
+        # short side is below max_size (e.g. 2592x1944 at 1024)
+        ratio = max_size / max(img.size)
+        img.draft('RGB', tuple(max(1, int(dim * ratio)) for dim in img.size))
+
+    if max(img.size) > max_size:
+        ratio = max_size / max(img.size)
+        new_size = tuple(max(1, int(dim * ratio)) for dim in img.size)
+        img = img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+class ImagePreprocessor:
+    """Runs preprocess_photo off the event loop with a bounded queue"""
+
+    def __init__(
+        self,
+        executor: str = 'process',
+        max_workers: Optional[int] = None,
+        max_pending: int = 32,
+        max_size: int = 1024,
+        quality: int = 85,
+        use_draft: bool = True,
+        reducing_gap: Optional[float] = None
+    ):
+        if executor == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending
+        self.pending = 0
+        self._preprocess = partial(
+            preprocess_photo,
+            max_size=max_size,
+            quality=quality,
+            use_draft=use_draft,
+            reducing_gap=reducing_gap
+        )
+
+    async def preprocess(self, photo_bytes: bytes) -> bytes:
+        """Preprocess a photo in the executor, rejecting it if the queue is full"""
+        if self.pending >= self.max_pending:
+            raise ImageQueueFullError(f"{self.pending} photos already queued")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._preprocess, bytes(photo_bytes))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
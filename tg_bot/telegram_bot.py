@@ -1,49 +1,153 @@
 import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import json
 import os
-import requests
+import uuid
+import httpx
 import logging
 from telegram import Update
 from telegram.constants import ChatAction
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
-import base64
-from io import BytesIO
-from PIL import Image
+from image_preprocessing import ImagePreprocessor, ImageQueueFullError
+
+# ID of the update being handled, sent to the API server as X-Request-ID
+request_id_var = ContextVar('request_id', default='-')
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
 
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
     level=logging.INFO
 )
+for log_handler in logging.getLogger().handlers:
+    log_handler.addFilter(RequestIdFilter())
 logger = logging.getLogger(__name__)
 
 SERVER_URL = os.environ.get('SERVER_URL', 'http://localhost:5000')
+# Minimum seconds between edits of a streamed reply (Telegram rate-limits edits)
+STREAM_EDIT_INTERVAL = float(os.environ.get('STREAM_EDIT_INTERVAL', 1.0))
+# Updates handled in parallel by python-telegram-bot (different chats run concurrently)
+BOT_CONCURRENT_UPDATES = int(os.environ.get('BOT_CONCURRENT_UPDATES', 256))
+# In-flight requests to the API server and its keep-alive connection pool
+SERVER_MAX_CONCURRENT_REQUESTS = int(os.environ.get('SERVER_MAX_CONCURRENT_REQUESTS', 64))
+SERVER_CONNECT_TIMEOUT = float(os.environ.get('SERVER_CONNECT_TIMEOUT', 5))
+# Covers a whole agent turn for /message, or the gap between streamed events
+SERVER_READ_TIMEOUT = float(os.environ.get('SERVER_READ_TIMEOUT', 300))
+# Photo preprocessing: executor kind ("process" or "thread"), workers and queue limit
+IMAGE_EXECUTOR = os.environ.get('IMAGE_EXECUTOR', 'process')
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+IMAGE_QUEUE_LIMIT = int(os.environ.get('IMAGE_QUEUE_LIMIT', 16))
+IMAGE_MAX_SIZE = int(os.environ.get('IMAGE_MAX_SIZE', 1024))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 85))
+# Decode JPEGs directly at reduced scale (Image.draft)
+IMAGE_DRAFT_DECODE = os.environ.get('IMAGE_DRAFT_DECODE', 'true').lower() in ('1', 'true', 'yes')
+# Pillow reduce-based resampling gap (e.g. 2.0 or 3.0); unset disables it
+IMAGE_REDUCING_GAP = float(os.environ['IMAGE_REDUCING_GAP']) if os.environ.get('IMAGE_REDUCING_GAP') else None
+# Quiet period after a text message before the chat's buffered messages are sent as one; 0 disables
+MESSAGE_DEBOUNCE_SECONDS = float(os.environ.get('MESSAGE_DEBOUNCE_SECONDS', 1.5))
+# Upper bound on how long the first buffered message may wait
+MESSAGE_DEBOUNCE_MAX_SECONDS = float(os.environ.get('MESSAGE_DEBOUNCE_MAX_SECONDS', 6))
+# Telegram shows a chat action for ~5 seconds, so it is re-sent more often than that
+TYPING_REFRESH_SECONDS = 4
+
+async def iter_sse_events(response):
+    """Parse a server-sent event stream into (event, data) pairs"""
+    event, data_lines = 'message', []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = 'message', []
+        elif line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data_lines.append(line[len('data:'):].lstrip())
+
+class PendingMessages:
+    """Text messages of one chat waiting out the debounce window"""
+
+    def __init__(self, first_at: float):
+        self.texts = []
+        self.update = None
+        self.first_at = first_at
+        self.flush_task = None
+        self.typing_task = None
 
 class TelegramAgentBot:
     def __init__(self, token):
         self.token = token
+        # Shared keep-alive client to the API server, opened in post_init
+        self.http_client = None
+        self.server_slots = None
+        self.image_preprocessor = ImagePreprocessor(
+            executor=IMAGE_EXECUTOR,
+            max_workers=IMAGE_WORKERS,
+            max_pending=IMAGE_QUEUE_LIMIT,
+            max_size=IMAGE_MAX_SIZE,
+            quality=IMAGE_JPEG_QUALITY,
+            use_draft=IMAGE_DRAFT_DECODE,
+            reducing_gap=IMAGE_REDUCING_GAP
+        )
+        # chat_id -> PendingMessages still inside the debounce window
+        self.pending_messages = {}
+
+    async def post_init(self, application):
+        """Open the pooled HTTP client once the bot's event loop is running"""
+        self.http_client = httpx.AsyncClient(
+            base_url=SERVER_URL,
+            limits=httpx.Limits(
+                max_connections=SERVER_MAX_CONCURRENT_REQUESTS,
+                max_keepalive_connections=SERVER_MAX_CONCURRENT_REQUESTS
+            ),
+            timeout=httpx.Timeout(
+                connect=SERVER_CONNECT_TIMEOUT,
+                read=SERVER_READ_TIMEOUT,
+                write=SERVER_CONNECT_TIMEOUT,
+                pool=SERVER_READ_TIMEOUT
+            )
+        )
+        self.server_slots = asyncio.Semaphore(SERVER_MAX_CONCURRENT_REQUESTS)
+
+    async def post_shutdown(self, application):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        self.image_preprocessor.shutdown()
+
+    async def post(self, path, payload=None, **kwargs):
+        """POST JSON (or a multipart body via files=/data=) to the API server"""
+        async with self.server_slots:
+            return await self.http_client.post(
+                path, json=payload, headers={'X-Request-ID': request_id_var.get()}, **kwargs
+            )
+
+    @asynccontextmanager
+    async def stream(self, path, payload):
+        """POST JSON to the API server and stream the response body"""
+        async with self.server_slots:
+            async with self.http_client.stream(
+                'POST', path, json=payload, headers={'X-Request-ID': request_id_var.get()}
+            ) as response:
+                yield response
 
     async def start(self, update: Update, context):
         """Handler for /start command"""
+        request_id_var.set(uuid.uuid4().hex)
         user_id = str(update.effective_user.id)
 
         try:
             # Initialize new session
-            response = requests.post(
-                f'{SERVER_URL}/initialize',
-                json={'user_id': user_id}
-            )
+            response = await self.post('/initialize', {'user_id': user_id})
 
             if response.status_code == 200:
                 # Clear any existing data
-                requests.post(
-                    f'{SERVER_URL}/clear',
-                    json={'user_id': user_id}
-                )
+                await self.post('/clear', {'user_id': user_id})
 
                 # Reinitialize
-                response = requests.post(
-                    f'{SERVER_URL}/initialize',
-                    json={'user_id': user_id}
-                )
+                response = await self.post('/initialize', {'user_id': user_id})
 
                 await update.message.reply_text(
                     "Добрый день! Я ассистент медицинской диагностики, не могли бы вы представится и мы можем начать"
@@ -52,17 +156,17 @@ class TelegramAgentBot:
                 await update.message.reply_text("Sorry, there was an issue initializing your session.")
 
         except Exception as e:
-            logger.error(f"Initialization error: {e}")
+            logger.error("Initialization error: %s", e)
             await update.message.reply_text("An error occurred while starting the bot.")
 
     async def handle_photo(self, update: Update, context):
         """Handle incoming photos"""
+        request_id_var.set(uuid.uuid4().hex)
         user_id = str(update.effective_user.id)
 
         try:
             # Get only the highest quality photo (last in the list)
             photo = update.message.photo[-1]  # Telegram sorts photos by size, last one is the biggest
-            base64_images = []
 
             # Show processing message
             processing_message = await update.message.reply_text(
@@ -73,29 +177,20 @@ class TelegramAgentBot:
             photo_file = await context.bot.get_file(photo.file_id)
             photo_bytes = await photo_file.download_as_bytearray()
 
-            # Convert to base64
-            img_buffer = BytesIO(photo_bytes)
-            img = Image.open(img_buffer)
-
-            # Optionally, you can add image optimization here
-            # For example, resize if too large
-            max_size = 1024  # Maximum dimension
-            if max(img.size) > max_size:
-                ratio = max_size / max(img.size)
-                new_size = tuple(int(dim * ratio) for dim in img.size)
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-            buffer = BytesIO()
-            img.save(buffer, format="JPEG", quality=85)  # Adjust quality as needed
-            base64_images.append(base64.b64encode(buffer.getvalue()).decode('utf-8'))
-
-            # Send image for processing
-            response = requests.post(
-                f'{SERVER_URL}/process_images',
-                json={
-                    'user_id': user_id,
-                    'images': base64_images
-                }
+            # Decode, downscale and re-encode in the preprocessing pool
+            try:
+                jpeg_bytes = await self.image_preprocessor.preprocess(photo_bytes)
+            except ImageQueueFullError:
+                await processing_message.edit_text(
+                    "Сейчас обрабатывается слишком много изображений, попробуйте позже."
+                )
+                return
+
+            # Send raw JPEG bytes for processing, no base64 round trip
+            response = await self.post(
+                '/process_images/upload',
+                data={'user_id': user_id},
+                files=[('images', ('photo.jpg', jpeg_bytes, 'image/jpeg'))]
             )
 
             if response.status_code == 200:
@@ -111,59 +206,143 @@ class TelegramAgentBot:
             await processing_message.delete()
 
         except Exception as e:
-            logger.error(f"Image processing error: {e}")
+            logger.error("Image processing error: %s", e)
             await update.message.reply_text(
                 "Произошла ошибка при обработке изображения."
             )
 
     async def handle_message(self, update: Update, context):
-        """Process incoming messages"""
-        user_id = str(update.effective_user.id)
-        message = update.message.text
+        """Buffer incoming text messages and send each burst as one request"""
+        # Tasks created below inherit it, so a burst carries its last message's ID
+        request_id_var.set(uuid.uuid4().hex)
+        chat_id = update.effective_chat.id
+        if MESSAGE_DEBOUNCE_SECONDS <= 0:
+            typing_task = context.application.create_task(self.keep_typing(context.bot, chat_id))
+            try:
+                await self.send_message(update, context, update.message.text)
+            finally:
+                typing_task.cancel()
+            return
 
-        try:
-            # Show typing indicator
-            await context.bot.send_chat_action(
-                chat_id=update.effective_chat.id,
-                action=ChatAction.TYPING
+        loop = asyncio.get_running_loop()
+        pending = self.pending_messages.get(chat_id)
+        if pending is None:
+            pending = self.pending_messages[chat_id] = PendingMessages(loop.time())
+            # Show typing while waiting for more fragments and for the reply
+            pending.typing_task = context.application.create_task(
+                self.keep_typing(context.bot, chat_id)
             )
+        else:
+            pending.flush_task.cancel()
+
+        pending.texts.append(update.message.text)
+        pending.update = update
+        delay = min(
+            MESSAGE_DEBOUNCE_SECONDS,
+            pending.first_at + MESSAGE_DEBOUNCE_MAX_SECONDS - loop.time()
+        )
+        pending.flush_task = context.application.create_task(
+            self.flush_messages(chat_id, context, max(delay, 0))
+        )
+
+    async def flush_messages(self, chat_id, context, delay: float):
+        """Send a chat's buffered messages once no new one arrived for delay seconds"""
+        await asyncio.sleep(delay)
+        # Later messages start a new buffer instead of cancelling this request
+        pending = self.pending_messages.pop(chat_id)
+        try:
+            await self.send_message(pending.update, context, "\n".join(pending.texts))
+        finally:
+            pending.typing_task.cancel()
 
-            # Send message to server
-            response = requests.post(
-                f'{SERVER_URL}/message',
-                json={
-                    'user_id': user_id,
-                    'message': {
-                        'role': 'user',
-                        'content': message
-                    }
+    async def keep_typing(self, bot, chat_id):
+        while True:
+            try:
+                await bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+            except Exception as e:
+                logger.warning("Failed to send typing action: %s", e)
+            await asyncio.sleep(TYPING_REFRESH_SECONDS)
+
+    async def send_message(self, update: Update, context, message: str):
+        """Send a user message to the agent and stream the reply into the chat"""
+        user_id = str(update.effective_user.id)
+
+        try:
+            # Stream the agent turn and progressively edit the reply
+            async with self.stream('/message/stream', {
+                'user_id': user_id,
+                'message': {
+                    'role': 'user',
+                    'content': message
                 }
-            )
+            }) as response:
+                if response.status_code != 200:
+                    await update.message.reply_text(
+                        "Извините, произошла ошибка при обработке сообщения."
+                    )
+                    return
 
-            if response.status_code == 200:
-                agent_responses = response.json().get('response', [])
-                for resp in agent_responses:
-                    if resp.get('content'):
-                        await update.message.reply_text(resp['content'])
-            else:
-                await update.message.reply_text(
-                    "Извините, произошла ошибка при обработке сообщения."
-                )
+                await self.relay_stream(update, response)
 
         except Exception as e:
-            logger.error(f"Message processing error: {e}")
+            logger.error("Message processing error: %s", e)
             await update.message.reply_text(
                 "Произошла ошибка при обработке вашего сообщения."
             )
 
+    async def relay_stream(self, update: Update, response):
+        """Mirror a /message/stream response into progressively edited replies"""
+        loop = asyncio.get_running_loop()
+        sent = []  # [telegram message, text shown] per assistant message
+        current = None  # index in sent of the message being streamed
+        text = ""
+        last_edit = 0.0
+
+        async def show(index, content):
+            if index < len(sent):
+                if sent[index][1] != content:
+                    await sent[index][0].edit_text(content)
+                    sent[index][1] = content
+            else:
+                sent.append([await update.message.reply_text(content), content])
+            return index
+
+        async for event, data in iter_sse_events(response):
+            if event == 'token':
+                text += data['content']
+                now = loop.time()
+                if text.strip() and now - last_edit >= STREAM_EDIT_INTERVAL:
+                    current = await show(len(sent) if current is None else current, text)
+                    last_edit = now
+            elif event == 'message_end':
+                if text.strip():
+                    await show(len(sent) if current is None else current, text)
+                current, text = None, ""
+            elif event == 'done':
+                # The server's assembled messages are authoritative
+                for index, resp in enumerate(data.get('response', [])):
+                    if resp.get('content'):
+                        await show(index, resp['content'])
+            elif event == 'error':
+                await update.message.reply_text(
+                    "Извините, произошла ошибка при обработке сообщения."
+                )
+
 def main():
     TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
     if not TOKEN:
         logging.error("No Telegram bot token provided")
         return
 
-    application = Application.builder().token(TOKEN).build()
     bot = TelegramAgentBot(TOKEN)
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .post_init(bot.post_init)
+        .post_shutdown(bot.post_shutdown)
+        .build()
+    )
 
     # Register handlers
     application.add_handler(CommandHandler("start", bot.start))